@@ -0,0 +1,283 @@
+import threading
+import time
+import numpy as np
+from vna_scpi import Scpi, trigger_hold
+from axis_cache import axis_key, get_axis
+from resonance import extract_resonance
+from preprocess import prepare
+
+binary_format = "FORM:DATA REAL" # 64-битный формат с плавающей точкой (REAL,64)
+binary_order = "FORM:BORD SWAP" # Порядок байт little-endian
+ascii_format = "FORM:DATA ASC"
+average_min = 2 # Минимум развёрток до проверки сходимости
+average_tol = 0.25 # Допустимая погрешность среднего f0, доли шага сетки
+zoom_points = 201 # Точек в грубой и точной развёртке
+zoom_span = 8 # Ширина точной развёртки в полосах резонанса
+frame_hooks = [] # hook(frame, config) вызывается для каждой снятой развёртки (журнал)
+ring_size = 32 # Сколько последних развёрток держать в памяти
+error_pause = 1 # Пауза после неудачной развёртки, с
+live_idle = 5 # Фоновая развёртка останавливается, если столько секунд никто не запрашивал кадр (live_frame)
+frame_pipeline = [] # Предобработка перед поиском резонанса в каждом кадре (preprocess.parse_pipeline); в кадре остаётся сырая трасса
+
+
+def read_caban(messager, start_f = 8, stop_f = 12, binary = True, trigger = True, points = None, cache_axis = True):
+    # cache_axis=False - разовая ось (точная развёртка зума): запрашивается каждый раз и в кэш осей не попадает, x_ref = None
+    # Время этапов: настройка, развёртка, передача, разбор, предобработка, поиск резонанса
+    timing = {}
+    stage = time.perf_counter()
+    scpi = Scpi(messager)
+    scpi.set("SENS:FREQ:STAR " + str(start_f) +" GHz")
+    scpi.set("SENS:FREQ:STOP " + str(stop_f) + " GHz")
+    if points is not None:
+        scpi.set("SENS1:SWE:POIN " + str(int(points)))
+    if binary:
+        scpi.set(binary_format)
+        scpi.set(binary_order)
+    else:
+        scpi.set(ascii_format)
+    if trigger:
+        scpi.set(trigger_hold)
+    scpi.flush()
+    # Ось частот запрашивается только при смене настроек развёртки
+    points, sweep_type = scpi.query("SENS1:SWE:POIN?;:SENS1:SWE:TYPE?").split(';')
+    key = axis_key(start_f, stop_f, points, sweep_type) if cache_axis else None
+    axis = get_axis if cache_axis else (lambda key, fetch: fetch())
+    timing['configure'] = time.perf_counter() - stage
+    stage = time.perf_counter()
+    if trigger:
+        # Данные читаются только после завершения новой развёртки
+        scpi.sweep()
+    timing['sweep'] = time.perf_counter() - stage
+    stage = time.perf_counter()
+    if binary:
+        # Трасса приходит блоком float64 сразу в массивы numpy
+        tmp = scpi.query_binary("CALC1:DATA:FDAT?")
+        tmp_x = axis(key, lambda: scpi.query_binary("CALC1:DATA:XAXis?"))
+        if isinstance(tmp, int) or isinstance(tmp_x, int):
+            return 0
+        timing['transfer'] = time.perf_counter() - stage
+        stage = time.perf_counter()
+    else:
+        tmp = scpi.query("CALC1:DATA:FDAT?")
+        tmp_x = axis(key, lambda: np.array(scpi.query("CALC1:DATA:XAXis?").split(","), dtype=np.float64))
+        if tmp == 0 or isinstance(tmp_x, int):
+            return 0
+        timing['transfer'] = time.perf_counter() - stage
+        stage = time.perf_counter()
+        tmp = np.array(tmp.split(","), dtype=np.float64)
+    # FDAT отдаёт пары (re, im), форматированное значение в чётных позициях
+    y = tmp[0::2]
+    timing['parse'] = time.perf_counter() - stage
+    stage = time.perf_counter()
+    y_prep = prepare(tmp_x, y, frame_pipeline)
+    timing['preprocess'] = time.perf_counter() - stage
+    stage = time.perf_counter()
+    resonance = extract_resonance(tmp_x, y_prep)
+    timing['analysis'] = time.perf_counter() - stage
+    frame = {'x': tmp_x, 'y': y, 'x_ref': key, 'timing': timing, 'resonance': resonance}
+    if frame_hooks:
+        config = {'address': messager.res.resource_name, 'start_f': start_f, 'stop_f': stop_f, 'points': int(points),
+                  'sweep_type': sweep_type.strip(), 'binary': binary, 'trigger': trigger}
+        for hook in frame_hooks:
+            hook(frame, config)
+    return frame
+
+
+def read_zoom(messager, start_f = 8, stop_f = 12, binary = True, points = zoom_points, span = zoom_span):
+    # Грубая развёртка по всей полосе, затем точная вокруг найденного провала.
+    # Кэшируется только ось грубой развёртки: окно точной зависит от f0, такие оси не повторяются
+    restore = int(Scpi(messager).query("SENS1:SWE:POIN?"))
+    try:
+        coarse = read_caban(messager, start_f, stop_f, binary, points=points)
+        if coarse == 0:
+            return 0
+        arr_x = coarse['x']
+        res = coarse['resonance']
+        step = arr_x[1] - arr_x[0]
+        band = max(res['f2'] - res['f1'], 2 * step)
+        f0 = res['f0']
+        zoom_start = max(f0 - span * band / 2, arr_x[0])
+        zoom_stop = min(f0 + span * band / 2, arr_x[-1])
+        fine = read_caban(messager, zoom_start / 10**9, zoom_stop / 10**9, binary, points=points, cache_axis=False)
+        if fine == 0:
+            return 0
+    finally:
+        # Число точек анализатора возвращается и при неудачной развёртке
+        if restore != points:
+            Scpi(messager).set("SENS1:SWE:POIN " + str(restore)).flush()
+    # Вне окна берутся точки грубой развёртки, внутри - точной
+    outside = (arr_x < fine['x'][0]) | (arr_x > fine['x'][-1])
+    merged_x = np.concatenate((arr_x[outside], fine['x']))
+    merged_y = np.concatenate((coarse['y'][outside], fine['y']))
+    order = np.argsort(merged_x, kind='stable')
+    timing = {stage: coarse['timing'].get(stage, 0) + fine['timing'].get(stage, 0) for stage in coarse['timing']}
+    return {'x': merged_x[order], 'y': merged_y[order], 'x_ref': None, 'timing': timing, 'zoom': {'start': float(fine['x'][0]), 'stop': float(fine['x'][-1])}}
+
+
+def sweep_stats(arr_x, stack):
+    # Статистика по стопке трасс (развёртки x точки): средняя трасса, СКО по точкам, f0 и Q каждой развёртки
+    arr_x = np.asarray(arr_x, dtype=np.float64)
+    res = extract_resonance(arr_x, stack)
+    step = arr_x[1] - arr_x[0]
+    f0 = res['f0']
+    Q = f0 / np.maximum(res['f2'] - res['f1'], step)
+    n = len(stack)
+    return {'n': n, 'y': stack.mean(axis=0), 'y_std': stack.std(axis=0), 'f0': f0, 'Q': Q,
+            'f0_mean': float(f0.mean()), 'f0_std': float(f0.std()), 'Q_mean': float(Q.mean()), 'Q_std': float(Q.std()),
+            'f0_err': float(f0.std() / np.sqrt(n)), 'step': float(step)}
+
+
+def average_frames(next_frame, n = 8, tol = average_tol):
+    # До n развёрток от next_frame(); остановка, когда погрешность среднего f0 меньше tol шага.
+    # Смена оси частот посреди серии начинает усреднение заново
+    frames = []
+    for i in range(n):
+        data = next_frame()
+        if data == 0:
+            return 0
+        if frames and (data['x_ref'] != frames[-1]['x_ref'] or len(data['y']) != len(frames[-1]['y'])):
+            frames = []
+        frames.append(data)
+        stats = sweep_stats(data['x'], np.array([frame['y'] for frame in frames]))
+        k = len(frames)
+        if k >= average_min and stats['f0_err'] <= tol * stats['step'] and stats['Q_std'] <= tol * stats['Q_mean'] / np.sqrt(k):
+            break
+    timing = {stage: sum(frame.get('timing', {}).get(stage, 0) for frame in frames) for stage in frames[0].get('timing', {})}
+    return {'x': data['x'], 'y': stats['y'], 'x_ref': data['x_ref'], 'timing': timing, 'stats': stats}
+
+
+def read_average(messager, n = 8, start_f = 8, stop_f = 12, binary = True, tol = average_tol):
+    # Развёртки подряд в одном сеансе (настройки, отличные от фоновой развёртки)
+    return average_frames(lambda: read_caban(messager, start_f, stop_f, binary), n, tol)
+
+
+def average_record(stats):
+    # Сводка усреднения для записи в файл измерения
+    return {'n': stats['n'], 'f0': stats['f0_mean'], 'f0_std': stats['f0_std'], 'Q': stats['Q_mean'], 'Q_std': stats['Q_std'],
+            'y_std': stats['y_std'].tolist()}
+
+
+class RingBuffer():
+    # Кольцевой буфер кадров (x, y, время) фиксированного размера
+    def __init__(self, size=ring_size):
+        self.size = size
+        self.y = None
+        self.x = [None] * size
+        self.x_ref = [None] * size
+        self.start = np.zeros(size)
+        self.time = np.zeros(size)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def write(self, frame, start, stop):
+        y = np.asarray(frame['y'], dtype=np.float64)
+        with self.lock:
+            if self.y is None or self.y.shape[1] != y.shape[0]:
+                # Сменилось число точек - буфер перевыделяется
+                self.y = np.empty((self.size, y.shape[0]))
+                self.count = 0
+            i = self.count % self.size
+            self.y[i] = y
+            self.x[i] = frame['x']
+            self.x_ref[i] = frame.get('x_ref')
+            self.start[i] = start
+            self.time[i] = stop
+            self.count += 1
+            return self.count
+
+    def _frame(self, i):
+        return {'x': self.x[i], 'y': self.y[i].copy(), 'x_ref': self.x_ref[i], 'start': self.start[i], 'time': self.time[i]}
+
+    def latest(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self._frame((self.count - 1) % self.size)
+
+    def since(self, count):
+        # Кадры, записанные после count-го (не больше размера буфера)
+        with self.lock:
+            first = max(count, self.count - self.size)
+            return [self._frame(n % self.size) for n in range(first, self.count)]
+
+
+class Acquisition():
+    # Фоновая непрерывная развёртка: sweep() возвращает {'x', 'y', 'x_ref'} или 0
+    def __init__(self, sweep, size=ring_size):
+        self.sweep = sweep
+        self.buffer = RingBuffer(size)
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.used = 0
+
+    def start(self):
+        # Каждый вызов продлевает работу: без вызовов дольше live_idle развёртка останавливается сама.
+        # True - развёртка только что запущена (в буфере могут быть только старые кадры)
+        with self.cond:
+            self.used = time.monotonic()
+            if self.running:
+                return False
+            self.running = True
+            self.thread = threading.Thread(target=self._loop, name='acquisition', daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def _loop(self):
+        while self.running:
+            with self.cond:
+                if time.monotonic() - self.used > live_idle:
+                    # Анализатор и сеанс свободны для съёма измерений, кадры не пишутся в журнал
+                    self.running = False
+                    self.cond.notify_all()
+                    return
+            start = time.monotonic()
+            frame = self.sweep()
+            if frame == 0:
+                time.sleep(error_pause)
+                continue
+            with self.cond:
+                self.buffer.write(frame, start, time.monotonic())
+                self.cond.notify_all()
+
+    def latest(self):
+        return self.buffer.latest()
+
+    def fresh(self, n=1, timeout=30):
+        # n кадров, развёртка которых началась после вызова
+        if not self.running:
+            frames = [self.sweep() for i in range(n)]
+            if any(frame == 0 for frame in frames):
+                return 0
+            return frames
+        request = time.monotonic()
+        deadline = request + timeout
+        with self.cond:
+            count = max(self.buffer.count - 1, 0)
+            while True:
+                frames = [frame for frame in self.buffer.since(count) if frame['start'] >= request]
+                if len(frames) >= n:
+                    return frames[:n]
+                left = deadline - time.monotonic()
+                if left <= 0 or not self.running:
+                    return 0
+                self.cond.wait(left)
+
+    def frame(self, timeout=30):
+        frames = self.fresh(1, timeout)
+        if frames == 0:
+            return 0
+        return frames[0]
+
+    def averaged(self, n, timeout=30, tol=average_tol):
+        # Усреднение по свежим кадрам фоновой развёртки с той же остановкой по сходимости, что и read_average
+        def next_frame():
+            self.start()
+            return self.frame(timeout)
+        return average_frames(next_frame, n, tol)
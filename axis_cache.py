@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import numpy as np
+
+axis_dir = 'data_axis'
+
+_axes = {}
+_axes_lock = threading.Lock()
+
+
+def axis_key(start_f, stop_f, points, sweep_type):
+    # Ось частот зависит только от настроек развёртки: старт, стоп (ГГц), число точек, тип
+    return str(int(round(float(start_f) * 10**9))) + '_' + str(int(round(float(stop_f) * 10**9))) + '_' + str(int(points)) + '_' + str(sweep_type).strip().upper()
+
+
+def save_axis(key, arr_x):
+    # Ось хранится в базе (её не потерять вместе с data_axis/), файл - быстрая копия для чтения
+    from measure_db import store_axis # measure_db сам импортирует этот модуль
+    store_axis(key, arr_x)
+    write_axis_file(key, arr_x)
+
+
+def write_axis_file(key, arr_x):
+    os.makedirs(axis_dir, exist_ok=True)
+    f = open(axis_dir + '/' + key + '.txt', 'w')
+    f.write(json.dumps(np.asarray(arr_x, dtype=np.float64).tolist()))
+    f.close()
+
+
+def load_axis(key):
+    # Память, затем data_axis/, затем база (файл при этом восстанавливается)
+    with _axes_lock:
+        if key in _axes:
+            return _axes[key]
+    try:
+        with open(axis_dir + '/' + key + '.txt') as file:
+            arr_x = np.array(json.load(file), dtype=np.float64)
+    except FileNotFoundError:
+        from measure_db import stored_axis
+        arr_x = stored_axis(key)
+        if arr_x is None:
+            raise
+        write_axis_file(key, arr_x)
+    with _axes_lock:
+        _axes[key] = arr_x
+    return arr_x
+
+
+def get_axis(key, fetch):
+    # fetch() запрашивает ось у анализатора только при смене настроек развёртки
+    with _axes_lock:
+        if key in _axes:
+            return _axes[key]
+    try:
+        return load_axis(key)
+    except FileNotFoundError:
+        pass
+    arr_x = fetch()
+    if isinstance(arr_x, int):
+        return arr_x
+    arr_x = np.asarray(arr_x, dtype=np.float64)
+    save_axis(key, arr_x)
+    with _axes_lock:
+        _axes[key] = arr_x
+    return arr_x
+
+
+def measure_x(data):
+    # Старые измерения хранят ось целиком, новые - ссылку на ось в базе и data_axis/
+    if 'x' in data:
+        return np.array(data['x'], dtype=np.float64)
+    try:
+        return load_axis(data['x_ref'])
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Ось {data['x_ref']} не найдена ни в {axis_dir}/, ни в базе") from None
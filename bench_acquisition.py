@@ -0,0 +1,56 @@
+import argparse
+import time
+import numpy as np
+from vna_sim import Analyzer, load_resonances, serve
+from vna_session import get_session
+from acquisition import read_caban
+
+# Замер скорости съёма трасс на имитаторе анализатора
+
+stages = ['configure', 'sweep', 'transfer', 'parse', 'preprocess', 'analysis']
+
+
+def toFixed(numObj, digits=0):
+    return f"{numObj:.{digits}f}"
+
+
+def bench(address, count, binary=True, start_f=8, stop_f=12):
+    session = get_session(address)
+    session.run(read_caban, start_f, stop_f, binary)  # Прогрев: соединение и кэш оси
+    timing = {stage: [] for stage in stages}
+    start = time.perf_counter()
+    for i in range(count):
+        data = session.run(read_caban, start_f, stop_f, binary)
+        for stage in stages:
+            timing[stage].append(data['timing'].get(stage, 0))
+    total = time.perf_counter() - start
+    return total, timing
+
+
+def report(title, count, total, timing):
+    print(title)
+    print("{:30}".format("Sweeps per second") + "{:>20}".format(toFixed(count / total, 2)))
+    print("{:30}".format("Stage") + "{:>20}".format("mean, ms") + "{:>20}".format("p95, ms"))
+    for stage in stages:
+        arr = np.array(timing[stage]) * 1000
+        print("{:30}".format(stage) + "{:>20}".format(toFixed(arr.mean(), 3)) + "{:>20}".format(toFixed(np.percentile(arr, 95), 3)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замер скорости съёма трасс')
+    parser.add_argument('--port', type=int, default=5026)
+    parser.add_argument('--seed-file', default='r_data.txt')
+    parser.add_argument('--points', type=int, default=801)
+    parser.add_argument('--sweep-time', type=float, default=0.05)
+    parser.add_argument('--noise', type=float, default=0.05)
+    parser.add_argument('--count', type=int, default=50)
+    args = parser.parse_args()
+
+    analyzer = Analyzer(load_resonances(args.seed_file), args.points, args.sweep_time, args.noise)
+    server = serve(analyzer, args.port)
+    address = "TCPIP0::localhost::" + str(args.port) + "::SOCKET"
+    for binary in (True, False):
+        total, timing = bench(address, args.count, binary)
+        report("Binary REAL,64" if binary else "ASCII", args.count, total, timing)
+        print()
+    server.shutdown()
@@ -1,99 +1,87 @@
-import pyvisa
 import pandas as pd
 import eel
 from random import randint
-import sqlite3
 import json
 import datetime
 import pytz
 from numpy.random.mtrand import random
 import string
 import secrets
+import hashlib
 import numpy as np
 from All_Methods_3 import *
-import sqlite3 as sql
 import warnings
 from fpdf import FPDF
+from axis_cache import measure_x
+from uncertainty import freq_sigma
+from sample_pool import method_args, evaluate_samples
+from resonance import find_resonance, resonance_row, stack_traces, res_mode
+from preprocess import pipeline_for, prepare
+from acquisition import average_record, frame_hooks
+from stations import get_station, sweep_stations
+from sweep_journal import SweepJournal
+from measure_store import load_measure, save_measure, append_sample, append_updates, json_default
+from measure_db import execute, add_measure, add_sample, set_results, recent_measures, measure_card, backfill, preview
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-address = "TCPIP0::localhost::5025::SOCKET"
-
 def toFixed(numObj, digits=0):
     return f"{numObj:.{digits}f}"
 
-def closest_value(input_list, input_value):
-    arr = np.asarray(input_list)
-    i = (np.abs(arr - input_value)).argmin()
-    return arr[i]
-
-def DataArrDist(arr_x, arr_y):
-    float_list = [float(i) for i in arr_y]
-    index_res = float_list.index(min(float_list))
-    f0 = arr_x[index_res]
-    f1 = arr_x[float_list.index(closest_value(float_list[(index_res - 50):index_res], (min(float_list) + 3)))]
-    f2 = arr_x[float_list.index(closest_value(float_list[index_res:index_res + 50], (min(float_list) + 3)))]
-    Q = float(f0)/(float(f2)-float(f1))
-    return {'f0': f0, 'f1': f1, 'f2': f2, 'Q':Q}
+results_version = 2 # Увеличить при изменении методов расчёта: все сохранённые результаты станут устаревшими
 
+def trace_hash(trace):
+    return hashlib.sha1(np.asarray(trace, dtype=np.float64).tobytes()).hexdigest()
 
-class Messager():
-    def __init__(self):
-        rm = pyvisa.ResourceManager()
+def measure_key(data):
+    # Всё, от чего зависят результаты всех образцов: параметры метода, резонатор без образца, ось, способ поиска резонанса и предобработка
+    if 'trace_hash' not in data:
+        data['trace_hash'] = trace_hash(data['y_res'])
+    return hashlib.sha1(json.dumps([results_version, data['data_param'], data['f0'], data['f1'], data['f2'], data['A0'],
+                                    data.get('x_ref'), data.get('res_mode', 'bin'), data.get('preprocess', []), data['trace_hash']]).encode()).hexdigest()
 
-        self.res = rm.open_resource(address, timeout=500)
-    def query(self, message:str):
-        self.res.read_termination = '\n'
-        self.res.write_termination = '\n'
+def sample_key(data, ref_key, i):
+    sample = data['y_samples'][i]
+    if 'trace_hash' not in sample:
+        sample['trace_hash'] = trace_hash(sample['y_res'])
+    return hashlib.sha1(json.dumps([ref_key, sample['trace_hash'], sample['fe'], sample['AE']]).encode()).hexdigest()
 
-        try:
-            tmp = self.res.query(message)
-            # print("{:30}".format("Message: " + message) + "{:>40}".format(" return: " + tmp))
-            return tmp
-        except pyvisa.errors.VisaIOError:
-            print("{:30}".format("Message: " + message) + "{:>40}".format(" not answer"))
-            print("ERROR ERROR")
-            return 0
+def cached_result(sample):
+    arr_results = {'status': 'ok', 'E': sample['E'], 'tgo': sample['tgo']}
+    arr_results.update(sample.get('ci', {}))
+    return arr_results
 
+sweep_average = 4 # Сколько развёрток усреднять для резонатора и образцов
 
-    def write(self, message: str):
-        self.res.read_termination = '\n'
-        self.res.write(message)
-        print("{:30}".format("Message: " + message))
+journal = SweepJournal() # Журнал всех снятых развёрток (data_journal/)
+journal.start()
+frame_hooks.append(journal.append)
 
+@eel.expose
+def request_caban(start_f = 8, stop_f = 12, binary = True, station = None):
+    # Для страницы - только ось и трасса списками, как раньше (массивы numpy eel не передаёт)
+    data = get_station(station).sweep(start_f, stop_f, binary)
+    if data == 0:
+        return 0
+    return {'x': data['x'].tolist(), 'y': data['y'].tolist()}
 
+def request_zoom(start_f = 8, stop_f = 12, binary = True, station = None):
+    return get_station(station).zoom(start_f, stop_f, binary)
 
+def request_average(n = sweep_average, start_f = 8, stop_f = 12, binary = True, station = None):
+    return get_station(station).average(n, start_f, stop_f, binary)
 
-@eel.expose
-def request_caban(start_f = 8, stop_f = 12):
-    messager = Messager()
-    messager.query("SENS:FREQ:STAR " + str(start_f) +" GHz")
-    messager.query("SENS:FREQ:STOP " + str(stop_f) + " GHz")
-    tmp = messager.query("CALC1:DATA:FDAT?").split(",")
-    tmp_x = messager.query("CALC1:DATA:XAXis?").split(",")
-    arr_end = []
-    i_q = 1
-    for i in tmp:
-        if i_q % 2 != 0:
-            arr_end.append(i)
-            # print(i)
-        i_q += 1
-    # print(arr_end)
-    # print(tmp_x)
-    # print(min(arr_end))
-    return {'x': tmp_x, 'y': arr_end}
-    # return json.dumps(' , '.join(map(str, arr_end)))
+def request_stations(station_ids, n = sweep_average):
+    # Одновременный съём на нескольких анализаторах
+    return sweep_stations(station_ids, 'average', n)
 
 @eel.expose
 def bd_create():
-    connection = sql.connect('data_base/test.db')
-    cursor = connection.cursor()
-    cursor.execute('INSERT INTO measures (method_id, measure_id, title) VALUES (?, ?, ?)',(2, 'djs893nid', 'TEST'))
-    connection.commit()
-    connection.close()
+    execute('INSERT INTO measures (method_id, measure_id, title) VALUES (?, ?, ?)',(2, 'djs893nid', 'TEST'))
 
 @eel.expose
 def ferro_query(method, pharams):
+    station = None
     if(pharams != 0):
         print(pharams)
         arr_method = json.dumps(pharams)
@@ -103,6 +91,15 @@ def ferro_query(method, pharams):
         for i in list_from_dict:
             arr_data[i[0]] = i[1]
         print(arr_data)
+        station = arr_data.get('station')
+
+    if method in ('new_create', 'new_sample', 'create_graph', 'create_graph_x'):
+        # Неизвестный стенд - тот же ответ, что и при неудачном съёме
+        try:
+            get_station(station)
+        except ValueError as error:
+            print(error)
+            return "ERROR"
 
     match method:
         case 'new_create':
@@ -133,215 +130,122 @@ def ferro_query(method, pharams):
             name_method = name + '_' + str(randint(1, 30)) + '_' + date
             time = str(current_time.hour) + ':' + str(current_time.minute)
 
-            data = request_caban()
+            data = request_average(station=station)
             if(data == 0):
                 status = 'error'
                 print('ERROR')
                 return "ERROR"
             else:
-                arr_end = data['y']
-                float_list = [float(i) for i in arr_end]
-                index_res = float_list.index(min(float_list))
-                f0 = data['x'][index_res]
-                f1 = data['x'][float_list.index(closest_value(float_list[(index_res-50):index_res], (min(float_list) + 3)))]
-                f2 = data['x'][float_list.index(closest_value(float_list[index_res:index_res+50], (min(float_list) + 3)))]
-                A0 = min(float_list)
+                stages = pipeline_for(arr_data_metod)
+                Dist = find_resonance(data['x'], prepare(data['x'], data['y'], stages), res_mode)
+                f0 = Dist['f0']
+                f1 = Dist['f1']
+                f2 = Dist['f2']
+                A0 = Dist['A0']
                 AE = 0
                 status = 'ok'
-                print(DataArrDist(data['x'], data['y']))
+                print(Dist)
 
-            data_file = {'data_param': arr_data_metod,'title': name_method, 'description': "", 'f0': f0,'f1': f1,'f2': f2, 'A0': A0, 'AE': AE,'date': date, 'time': time, 'x': data['x'], 'y_res':  data['y'],'y_samples': {} }
+            data_file = {'data_param': arr_data_metod,'title': name_method, 'description': "", 'f0': f0,'f1': f1,'f2': f2, 'A0': A0, 'AE': AE,'date': date, 'time': time, 'x_ref': data['x_ref'], 'y_res':  data['y'].tolist(), 'average': average_record(data['stats']), 'station': get_station(station).id, 'res_mode': res_mode, 'preprocess': stages,'y_samples': {} }
             print(data_file)
 
-            f = open('data_ferro/'+key+'.txt', 'w')
-            f.write(json.dumps(data_file))
-            f.close()
-
-            connection = sql.connect('data_base/test.db')
-            cursor = connection.cursor()
-            cursor.execute('INSERT INTO measures (method_id, measure_id, title, date_create) VALUES (?, ?, ?, ?)',(float(arr_data['method']), key, name_method, datetime.datetime.now()))
-            connection.commit()
-            connection.close()
+            save_measure(key, data_file)
 
-            with open('data_base/db_ferro.txt') as file:
-                data_db = json.load(file)
-                data_db[len(data_db)+1] = {'method_id': float(arr_data['method']), 'measure_id': key, "description": "После применения калибровочных мер.", 'title': name_method, 'date': date, 'time': time, }
-
-            f = open('data_base/db_ferro.txt', 'w')
-            f.write(json.dumps(data_db))
-            f.close()
+            add_measure(key, float(arr_data['method']), name_method, time, f0, Dist['Q'], preview(data['x'], data['y']), "После применения калибровочных мер.")
 
 
             answer = {'id': key, 'title': name_method, 'subtitle': subtitle, 'status':status}
             return json.dumps(answer)
         case 'new_sample':
             id_file = arr_data['id_m']
-            data = request_caban()
-            arr_end = data['y']
-            float_list = [float(i) for i in arr_end]
-            index_res = float_list.index(min(float_list))
-            fe = data['x'][index_res]
-            AE = min(float_list)
+            data = request_average(station=station)
             data_ref = data
-            with open('data_ferro/'+id_file+'.txt') as file:
-                data = json.load(file)
-                data['y_samples'][len(data['y_samples'])+1] = {'name': arr_data['new_sample_name'], 'y_res': data_ref['y'], 'fe': fe, 'AE': AE, 'tgo': 0, 'E':0}
-                # print(data)
-            f = open('data_ferro/'+id_file+'.txt', 'w')
-            f.write(json.dumps(data))
-            f.close()
+            # Нужны только параметры измерения, образец дописывается в журнал измерения
+            data = load_measure(id_file, arrays=False)
+            ResSample = find_resonance(data_ref['x'], prepare(data_ref['x'], data_ref['y'], data.get('preprocess', [])), data.get('res_mode', 'bin'))
+            fe = ResSample['f0']
+            AE = ResSample['A0']
+            sample_id = len(data['y_samples'])+1
+            append_sample(id_file, sample_id, {'name': arr_data['new_sample_name'], 'y_res': data_ref['y'], 'fe': fe, 'AE': AE, 'tgo': 0, 'E':0, 'average': average_record(data_ref['stats']), 'trace_hash': trace_hash(data_ref['y'])})
+            # Строка образца в базе; уменьшенная трасса нужна только первому образцу (карточка измерения)
+            add_sample(id_file, sample_id, arr_data['new_sample_name'], float(data['data_param']['method']), fe, ResSample['Q'],
+                       preview(data_ref['x'], data_ref['y']) if sample_id == 1 else None)
+            # print(data)
             return json.dumps({'id': id_file, 'name': arr_data['new_sample_name']})
         case 'create_graph':
-            data = request_caban()
-            return json.dumps(' , '.join(map(str, data['y'])))
+            data = get_station(station).live_frame()
+            return json.dumps(' , '.join(map(str, data['y'].tolist())))
         case 'create_graph_x':
-            data = request_caban()
-            return json.dumps(' , '.join(map(str, data['x'])))
+            data = get_station(station).live_frame()
+            return json.dumps(' , '.join(map(str, data['x'].tolist())))
         case 'method_end':
             id_file = arr_data['id_m']
-            with open('data_ferro/'+id_file+'.txt') as file:
-                data = json.load(file)
-                match data['data_param']['method']:
-                    case '1':
-                        for i in data['y_samples']:
-                            ResSample = DataArrDist(data['x'], data['y_samples'][i]['y_res'])
-                            arr_results =  Methot_Vlad(float(data['data_param']['data[1][t]']), float(data['data_param']['data[1][d_res]']),
-                                                       float(data['f0']), float(data['f1']), float(data['f2']), float(data['y_samples'][i]['fe']),
-                                                       float(data['data_param']['data[1][h_res]']), float(data['data_param']['data[1][del_L]']),
-                                                       float(data['A0']), float(data['y_samples'][i]['AE']))
-                            if(arr_results['status'] == 'ok'):
-                                data['y_samples'][i]['E'] = arr_results['E']
-                                data['y_samples'][i]['tgo'] = arr_results['tgo']
-                            else:
-                                print('Error')
-                                print(arr_results)
-
-
-                    case '2':
-                        for i in data['y_samples']:
-                            ResSample = DataArrDist(data['x'], data['y_samples'][i]['y_res'])
-                            arr_results = Methot_Nikita(float(data['data_param']['data[2][t]']),
-                                                        float(data['data_param']['data[2][d_res]']),
-                                                        float(data['data_param']['data[2][h_res]']), float(data['f0']),
-                                                        float(data['f1']), float(data['f2']), float(ResSample['f0']),
-                                                        float(data['A0']), float(data['y_samples'][i]['AE']))
-                            if(arr_results['status'] == 'ok'):
-                                data['y_samples'][i]['E'] = arr_results['E']
-                                data['y_samples'][i]['tgo'] = arr_results['tgo']
-                            else:
-                                print('Error')
-                                print(arr_results)
-
-
-
-                    case '3':
-                        for i in data['y_samples']:
-                            ResArr = DataArrDist(data['x'], data['y_res'])
-                            ResSample = DataArrDist(data['x'], data['y_samples'][i]['y_res'][:500])
-                            arr_results = Methot_Marina(float(data['data_param']['data[3][d]']), float(data['f0']),
-                                                        float(data['f1']), float(data['f2']), float(data['y_samples'][i]['fe']),
-                                                        float(data['data_param']['data[3][d_res]'])/2, float(data['data_param']['data[3][h_res]']),
-                                                        float(data['A0']),float(data['y_samples'][i]['AE']), float(ResArr['Q']), float(ResSample['Q']))
-                            # /print(a, f0, f1, f2, fE, R0, L, A0, AE, Q0, QE)
-                            if(arr_results['status'] == 'ok'):
-                                data['y_samples'][i]['E'] = arr_results['E']
-                                data['y_samples'][i]['tgo'] = arr_results['tgo']
-                            else:
-                                print('Error')
-                                print(arr_results)
-                    case '4':
-                        if float(data['data_param']['data[4][form]']) == 0:
-                            a = 1.12
-                            b = 1.12
-                        else:
-                            a = 1.12
-                            b = 1.12
-                        #arr_results = Methot_Egor(a, b, float(data['data_param']['data[4][d_sample]']), float(data['data_param']['data[4][d_res]']), f1, f1sh, deld, Ms, float(data['data_param']['data[4][form]']))
-                        for i in data['y_samples']:
-                            ResSample =  DataArrDist(data['x'], data['y_samples'][i]['y_res'])
-                            arr_results = Method_real(float(ResSample['f0']), float(data['f0']), float(data['f1']),
-                                                      float(data['f2']), float(ResSample['f1']), float(ResSample['f2']),
-                                                      float(data['data_param']['data[4][d_res]']), float(data['data_param']['data[4][d_sample]']))
-                            if (arr_results['status'] == 'ok'):
-                                data['y_samples'][i]['E'] = arr_results['E']
-                                data['y_samples'][i]['tgo'] = arr_results['tgo']
-                            else:
-                                print('Error')
-                                print(arr_results)
-
-            f = open('data_ferro/' + id_file + '.txt', 'w')
-            f.write(json.dumps(data))
-            f.close()
+            data = load_measure(id_file)
+            arr_x = measure_x(data)
+            # Считаются только новые или изменённые образцы: ключ образца - хэш трассы, fe, AE и общих входов
+            ref_key = measure_key(data)
+            arr_key = {i: sample_key(data, ref_key, i) for i in data['y_samples']}
+            keys = [i for i in data['y_samples'] if data['y_samples'][i].get('key') != arr_key[i]]
+            if not keys:
+                last = list(data['y_samples'])[-1] if data['y_samples'] else None
+                return json.dumps({'results': cached_result(data['y_samples'][last]) if last is not None else {}, 'id': id_file})
+            # Все образцы решаются одним вызовом метода (части образцов - параллельно в пуле процессов), погрешность - Монте-Карло
+            rows = evaluate_samples(data['data_param']['method'], method_args(data, keys, arr_x), len(keys), {'freq': freq_sigma(arr_x)})
+            # В журнал дописываются только новые результаты
+            updates = {'': {'trace_hash': data['trace_hash']}}
+            arr_db = {}
+            for i, arr_results in zip(keys, rows):
+                if(arr_results['status'] == 'ok'):
+                    updates[i] = {'E': arr_results['E'], 'tgo': arr_results['tgo'], 'key': arr_key[i], 'trace_hash': data['y_samples'][i]['trace_hash'],
+                                  'ci': {name: arr_results[name] for name in arr_results if name not in ('status', 'E', 'tgo')}}
+                    arr_db[i] = (arr_results['E'], arr_results['tgo'])
+                else:
+                    print('Error')
+                    print(arr_results)
+            append_updates(id_file, updates)
+            set_results(id_file, arr_db)
             return json.dumps({'results': arr_results, 'id': id_file})
         case 'read_data':
             id_file = arr_data['id_m']
-            with open('data_ferro/' + id_file+ '.txt' ) as file:
-                data = json.load(file)
-                data['Dist'] = DataArrDist(data['x'], data['y_res'])
-                for i in data['y_samples']:
-                    data['y_samples'][i]['Dist'] = DataArrDist(data['x'], data['y_samples'][i]['y_res'])
-                print(data)
-                return json.dumps(data)
+            data = load_measure(id_file)
+            arr_x = measure_x(data)
+            data['x'] = arr_x.tolist()
+            keys = list(data['y_samples'])
+            arr_y = prepare(arr_x, stack_traces([data['y_res']] + [data['y_samples'][i]['y_res'] for i in keys]), data.get('preprocess', []))
+            Res = find_resonance(arr_x, arr_y, data.get('res_mode', 'bin'))
+            data['Dist'] = resonance_row(Res, 0)
+            for k, i in enumerate(keys):
+                data['y_samples'][i]['Dist'] = resonance_row(Res, k + 1)
+            print(data)
+            return json.dumps(data, default=json_default)
         case 'measure_data':
+            # Карточки последних измерений из базы (сводные столбцы и уменьшенные трассы), файлы измерений не читаются
             arr_measures = []
-            connection = sql.connect('data_base/test.db')
-            cursor = connection.cursor()
-
-            # cursor.execute('DELETE  FROM measures  WHERE id = 1')
-            cursor.execute('SELECT * FROM measures order by id desc LIMIT 5')
-            data_db = cursor.fetchall()
-
-            for data in data_db:
-                print(data)
-                print(data[2])
-                try:
-                    with open('data_ferro/'+ data[2]+'.txt') as file_measure:
-                          data_measure = json.load(file_measure)
-                          data_measure['id_m'] = data[2]
-                          if 'tgo' in data_measure['y_samples']['1']:
-                              data_measure['y_samples']['1']['tgo'] = toFixed(data_measure['y_samples']['1']['tgo'] * 10 ** 4, 3)
-                          else:
-                              data_measure['y_samples']['1']['tgo'] = "??"
-
-                          if 'E' in data_measure['y_samples']['1']:
-                              data_measure['y_samples']['1']['E'] = toFixed(data_measure['y_samples']['1']['E'], 5)
-                          else:
-                              data_measure['y_samples']['1']['E'] = "??"
-                          # if data_measure['y_samples']['1']['tgo'] == '':
-                          #     data_measure['y_samples']['1']['tgo'] = "??"
-                          # else:
-                          #     data_measure['y_samples']['1']['tgo'] = toFixed(data_measure['y_samples']['1']['tgo'] * 10 ** 4, 3)
-
-                          arr_measures.append(data_measure)
-                except FileNotFoundError:
-                    print(f"Запрашиваемый файл {data[2]} не найден")
-            connection.commit()
-            connection.close()
-
-            # with open('data_base/db_ferro.txt' ) as file:
-            #     data_db = json.load(file)
-            #     # print(reversed(data_db))
-            #     i = 0
-            #     for data in reversed(data_db):
-            #         with open('data_ferro/'+data_db[data]['measure_id']+'.txt') as file_measure:
-            #             print(data_db[data]['measure_id'])
-            #             data_measure = json.load(file_measure)
-            #             data_measure['id_m'] = data_db[data]['measure_id']
-            #             if data_measure['y_samples']['1']['tgo'] == '':
-            #                 data_measure['y_samples']['1']['tgo'] = "??"
-            #             else:
-            #                 data_measure['y_samples']['1']['tgo'] = toFixed(data_measure['y_samples']['1']['tgo'] * 10 ** 4, 3)
-            #             data_measure['y_samples']['1']['E'] = toFixed(data_measure['y_samples']['1']['E'], 5)
-            #             arr_measures.append(data_measure)
-            #             i +=1
-            #             if i == 4:
-            #                  break
+            for row in recent_measures(5):
+                if row['preview'] is None:
+                    # Измерение снято до сводных столбцов - сводка один раз строится по файлу
+                    try:
+                        backfill(row['measure_id'])
+                    except FileNotFoundError:
+                        print(f"Запрашиваемый файл {row['measure_id']} не найден")
+                        continue
+                    row = measure_card(row['measure_id'])
+                arr_preview = json.loads(row['preview'])
+                sample = {'name': row['sample_name'], 'fe': row['fe'], 'Q': row['Q'],
+                          'y_res': json.loads(row['sample_preview'])['y'] if row['sample_preview'] else [],
+                          'tgo': toFixed(row['tgo'] * 10 ** 4, 3) if row['tgo'] is not None else "??",
+                          'E': toFixed(row['E'], 5) if row['E'] is not None else "??"}
+                arr_measures.append({'id_m': row['measure_id'], 'method_id': row['method_id'], 'title': row['title'], 'time': row['time'],
+                                     'date_create': row['date_create'], 'f0': row['f0'], 'Q0': row['Q0'],
+                                     'x': arr_preview['x'], 'y_res': arr_preview['y'], 'y_samples': {'1': sample}})
             arr_measures.reverse()
-            return json.dumps(arr_measures)
+            return json.dumps(arr_measures, default=json_default)
         case _:
             print('Неизвестный метод.')
 
 
-eel.init("ferro_web_v1") #Инициализации запускаемой дериктории проекта
-eel.browsers.set_path("ferro_brave", "brave-portable/brave-portable.exe") #Инициализации запускаемой дериктории проекта
-eel.start("home.html", mode='chrome', size=(1920,1080),  cmdline_args=[ '--start-fullscreen'])
+# Процессы пула (sample_pool) импортируют этот файл заново: окно запускается только в основном процессе
+if __name__ == '__main__':
+    eel.init("ferro_web_v1") #Инициализации запускаемой дериктории проекта
+    eel.browsers.set_path("ferro_brave", "brave-portable/brave-portable.exe") #Инициализации запускаемой дериктории проекта
+    eel.start("home.html", mode='chrome', size=(1920,1080),  cmdline_args=[ '--start-fullscreen'])
@@ -0,0 +1,291 @@
+import argparse
+import atexit
+import datetime
+import glob
+import json
+import os
+import sqlite3 as sql
+import threading
+from contextlib import contextmanager
+import numpy as np
+from axis_cache import measure_x, axis_dir
+from measure_store import load_measure
+from preprocess import prepare
+from resonance import find_resonance, stack_traces
+
+# База измерений data_base/test.db: measures - строка на измерение, samples - строка на образец с результатами.
+# Список измерений и сводки строятся одним запросом по индексам, файлы трасс при этом не читаются
+db_file = 'data_base/test.db'
+preview_points = 200 # Точек в уменьшенной трассе для карточки измерения (минимум по участку - провал не теряется)
+
+# Столбцы, добавленные к старой таблице measures
+measure_columns = {'time': 'TEXT NULL', 'f0': 'REAL NULL', 'Q0': 'REAL NULL', 'preview': 'TEXT NULL'}
+
+schema = [
+    '''CREATE TABLE IF NOT EXISTS measures (
+id INTEGER PRIMARY KEY,
+method_id INTEGER,
+measure_id VARCHAR(100) NULL,
+title VARCHAR(100) NULL,
+description TEXT NULL,
+user VARCHAR(100) NULL,
+data TEXT NULL,
+date_create TEXT NULL
+)''',
+    '''CREATE TABLE IF NOT EXISTS samples (
+id INTEGER PRIMARY KEY,
+measure_id VARCHAR(100) NOT NULL,
+sample_id VARCHAR(20) NOT NULL,
+name VARCHAR(100) NULL,
+method_id INTEGER,
+f0 REAL NULL,
+Q REAL NULL,
+E REAL NULL,
+tgo REAL NULL,
+preview TEXT NULL,
+date_create TEXT NULL,
+UNIQUE (measure_id, sample_id)
+)''',
+    '''CREATE TABLE IF NOT EXISTS axes (
+key VARCHAR(100) PRIMARY KEY,
+x BLOB NOT NULL
+)''',
+    'CREATE INDEX IF NOT EXISTS measures_date ON measures (date_create)',
+    'CREATE INDEX IF NOT EXISTS measures_method ON measures (method_id)',
+    'CREATE INDEX IF NOT EXISTS measures_measure ON measures (measure_id)',
+    'CREATE INDEX IF NOT EXISTS samples_method_date ON samples (method_id, date_create)',
+]
+
+# Одно соединение на процесс: WAL (чтение не ждёт записи), подготовленные запросы кэшируются модулем sqlite3
+db_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL', # В режиме WAL сбой питания может потерять только последние транзакции, база не портится
+    'cache_size': -16000, # Кэш страниц, КБ
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000, # Ожидание блокировки другим процессом, мс
+}
+db_statements = 256 # Размер кэша подготовленных запросов
+db_version = 2 # PRAGMA user_version после всех переносов: 1 - импортирован data_base/db_ferro.txt, 2 - оси из data_axis/
+legacy_index = 'data_base/db_ferro.txt' # Старый список измерений (JSON, переписывался целиком при каждом измерении)
+
+_db = None
+_db_pid = None
+_db_lock = threading.RLock() # Потоки (и гринлеты eel) обращаются к соединению по очереди
+
+
+def ensure_schema(connection):
+    # Старая (или только что созданная) таблица measures дополняется новыми столбцами
+    for statement in schema:
+        connection.execute(statement)
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(measures)')]
+    for name in measure_columns:
+        if name not in columns:
+            connection.execute(f'ALTER TABLE measures ADD COLUMN {name} {measure_columns[name]}')
+
+
+def import_index(connection, file_name=legacy_index):
+    # Однократный перенос db_ferro.txt в measures: недостающие измерения добавляются, у имеющихся заполняются описание и время
+    entries = {}
+    if os.path.exists(file_name):
+        with open(file_name) as file:
+            entries = json.load(file)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for n in sorted(entries, key=int):
+            entry = entries[n]
+            description = entry.get('description') or None
+            if connection.execute('SELECT 1 FROM measures WHERE measure_id = ?', (entry['measure_id'],)).fetchone():
+                connection.execute('UPDATE measures SET description = COALESCE(description, ?), time = COALESCE(time, ?) WHERE measure_id = ?',
+                                   (description, entry.get('time'), entry['measure_id']))
+            else:
+                date_create = str(datetime.datetime.strptime(entry['date'] + ' ' + entry.get('time', '0:0'), '%d%m%Y %H:%M'))
+                connection.execute('INSERT INTO measures (method_id, measure_id, title, description, date_create, time) VALUES (?, ?, ?, ?, ?, ?)',
+                                   (entry['method_id'], entry['measure_id'], entry['title'], description, date_create, entry.get('time')))
+        connection.execute('PRAGMA user_version = 1')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+def import_axes(connection):
+    # Однократный перенос осей, снятых до хранения в базе (data_axis/<key>.txt)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for file_name in glob.glob(axis_dir + '/*.txt'):
+            with open(file_name) as file:
+                arr_x = np.array(json.load(file), dtype='<f8')
+            key = os.path.splitext(os.path.basename(file_name))[0]
+            connection.execute('INSERT OR IGNORE INTO axes (key, x) VALUES (?, ?)', (key, arr_x.tobytes()))
+        connection.execute('PRAGMA user_version = 2')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+def db():
+    # Соединение процесса: открывается при первом обращении (и заново в дочернем процессе), схема проверяется один раз
+    global _db, _db_pid
+    with _db_lock:
+        if _db is None or _db_pid != os.getpid():
+            connection = sql.connect(db_file, check_same_thread=False, isolation_level=None, cached_statements=db_statements)
+            connection.row_factory = sql.Row
+            for name in db_pragmas:
+                connection.execute(f'PRAGMA {name} = {db_pragmas[name]}')
+            ensure_schema(connection)
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version < 1:
+                import_index(connection)
+            if version < 2:
+                import_axes(connection)
+            _db, _db_pid = connection, os.getpid()
+        return _db
+
+
+def close_db():
+    global _db
+    with _db_lock:
+        if _db is not None and _db_pid == os.getpid():
+            _db.close()
+        _db = None
+
+
+atexit.register(close_db)
+
+
+def execute(query, params=()):
+    # Один запрос вне транзакции фиксируется сразу (autocommit)
+    with _db_lock:
+        return db().execute(query, params)
+
+
+def fetch(query, params=()):
+    with _db_lock:
+        return [dict(row) for row in db().execute(query, params).fetchall()]
+
+
+@contextmanager
+def transaction():
+    # Несколько запросов (массовая вставка) - одна транзакция и одна запись журнала на диск
+    with _db_lock:
+        connection = db()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+def store_axis(key, arr_x):
+    # Ось частот по ключу axis_key (float64 little-endian); data_axis/ - только быстрая копия
+    execute('INSERT OR IGNORE INTO axes (key, x) VALUES (?, ?)', (key, np.asarray(arr_x, dtype='<f8').tobytes()))
+
+
+def stored_axis(key):
+    rows = fetch('SELECT x FROM axes WHERE key = ?', (key,))
+    if not rows:
+        return None
+    return np.frombuffer(rows[0]['x'], dtype='<f8').copy()
+
+
+def number(value):
+    # inf и nan (нет резонанса) хранятся как NULL
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def now():
+    return str(datetime.datetime.now())
+
+
+def preview(arr_x, arr_y, points=preview_points):
+    # Уменьшенная трасса: минимум на каждом из points участков
+    arr_y = np.asarray(arr_y, dtype=np.float64)
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:len(arr_y)]
+    if len(arr_y) <= points:
+        return json.dumps({'x': arr_x.tolist(), 'y': arr_y.tolist()})
+    idx = np.unique(np.linspace(0, len(arr_y), points + 1).astype(np.intp)[:-1])
+    return json.dumps({'x': arr_x[idx].tolist(), 'y': np.minimum.reduceat(arr_y, idx).tolist()})
+
+
+def add_measure(key, method_id, title, time, f0, Q0, arr_preview, description=None):
+    # Одна вставка - вместо перезаписи всего db_ferro.txt; measures - единственный список измерений
+    execute('INSERT INTO measures (method_id, measure_id, title, description, date_create, time, f0, Q0, preview) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (method_id, key, title, description, now(), time, number(f0), number(Q0), arr_preview))
+
+
+def measure_index(method_id=None):
+    # Список измерений (бывший db_ferro.txt) по порядку создания - для страниц и служебных скриптов
+    query = 'SELECT id, method_id, measure_id, title, description, date_create, time FROM measures'
+    if method_id is None:
+        return fetch(query + ' ORDER BY id')
+    return fetch(query + ' WHERE method_id = ? ORDER BY id', (method_id,))
+
+
+def add_sample(key, sample_id, name, method_id, f0, Q, arr_preview=None):
+    execute('INSERT OR REPLACE INTO samples (measure_id, sample_id, name, method_id, f0, Q, preview, date_create) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, str(sample_id), name, method_id, number(f0), number(Q), arr_preview, now()))
+
+
+def set_results(key, results):
+    # results - {номер образца: (E, tgo)}
+    with transaction() as connection:
+        connection.executemany('UPDATE samples SET E = ?, tgo = ? WHERE measure_id = ? AND sample_id = ?',
+                               [(number(results[i][0]), number(results[i][1]), key, str(i)) for i in results])
+
+
+card_query = """SELECT m.measure_id, m.method_id, m.title, m.time, m.date_create, m.f0, m.Q0, m.preview,
+s.name AS sample_name, s.f0 AS fe, s.Q, s.E, s.tgo, s.preview AS sample_preview
+FROM measures m LEFT JOIN samples s ON s.measure_id = m.measure_id AND s.sample_id = '1'"""
+
+
+def query_cards(where, params):
+    return fetch(card_query + where, params)
+
+
+def recent_measures(limit=5):
+    # Последние измерения с первым образцом - один запрос по индексам
+    return query_cards(' ORDER BY m.id DESC LIMIT ?', (limit,))
+
+
+def measure_card(key):
+    rows = query_cards(' WHERE m.measure_id = ?', (key,))
+    return rows[0] if rows else None
+
+
+def backfill(key):
+    # Сводка измерения, снятого до сводных столбцов: строится один раз по файлу измерения
+    data = load_measure(key)
+    arr_x = measure_x(data)
+    keys = list(data['y_samples'])
+    arr_y = prepare(arr_x, stack_traces([data['y_res']] + [data['y_samples'][i]['y_res'] for i in keys]), data.get('preprocess', []))
+    Res = find_resonance(arr_x, arr_y, data.get('res_mode', 'bin'))
+    method_id = float(data['data_param']['method'])
+    rows = []
+    for k, i in enumerate(keys):
+        sample = data['y_samples'][i]
+        # До расчёта образец хранит E = tgo = 0 (в старых файлах - пустую строку)
+        done = isinstance(sample.get('E'), (int, float)) and isinstance(sample.get('tgo'), (int, float)) and ('key' in sample or sample['E'] != 0)
+        rows.append((key, str(i), sample.get('name'), method_id, number(sample['fe']), number(Res['Q'][k + 1]),
+                     number(sample['E']) if done else None, number(sample['tgo']) if done else None,
+                     preview(arr_x, sample['y_res']) if str(i) == '1' else None, now()))
+    with transaction() as connection:
+        connection.execute('UPDATE measures SET time = ?, f0 = ?, Q0 = ?, preview = ? WHERE measure_id = ?',
+                           (data.get('time'), number(data['f0']), number(Res['Q'][0]), preview(arr_x, data['y_res']), key))
+        connection.executemany('INSERT OR REPLACE INTO samples (measure_id, sample_id, name, method_id, f0, Q, E, tgo, preview, date_create) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Заполнение сводных столбцов базы по файлам измерений')
+    parser.add_argument('--all', action='store_true', help='перестроить и уже заполненные измерения')
+    args = parser.parse_args()
+    keys = [row['measure_id'] for row in fetch('SELECT measure_id FROM measures' + ('' if args.all else ' WHERE preview IS NULL'))]
+    for key in keys:
+        try:
+            backfill(key)
+            print("{:50}".format(key) + "{:>20}".format('ok'))
+        except FileNotFoundError:
+            print("{:50}".format(key) + "{:>20}".format('нет файла'))
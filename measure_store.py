@@ -0,0 +1,342 @@
+import argparse
+import glob
+import json
+import os
+import struct
+import threading
+import numpy as np
+
+# Двоичный файл измерения: заголовок, JSON с параметрами и результатами, затем массивы (ось, трасса резонатора, трассы образцов).
+# Массивы читаются через memmap только по запросу; старые JSON-файлы data_ferro/<key>.txt читаются, пока не перенесены
+measure_dir = 'data_ferro'
+measure_ext = '.fms'
+trace_dtype = np.float64 # float32 вдвое компактнее, но меняет последние знаки трасс
+magic = b'FMS1'
+header = struct.Struct('<4sIQ') # метка, длина JSON, смещение начала массивов
+align = 64
+# Журнал измерения <key>.log рядом с файлом (общий для .fms и старого .txt): новые образцы и результаты дописываются записями, файл измерения не переписывается.
+# Записи идемпотентны (образец и поля задаются по номеру), поэтому повтор журнала после свёртки даёт то же состояние
+log_ext = '.log'
+log_magic = b'FML1'
+log_header = struct.Struct('<4sII') # метка, длина JSON, точек трассы
+log_compact_bytes = 1 << 18 # Журнал больше этого сворачивается в файл измерения (задержка добавления образца не растёт)
+
+_locks = {}
+_locks_lock = threading.Lock()
+_checked = set() # Журналы, проверенные этим процессом на недописанную запись
+
+
+def measure_file(key):
+    return measure_dir + '/' + key + measure_ext
+
+
+def legacy_file(key):
+    return measure_dir + '/' + key + '.txt'
+
+
+def log_file(file_name):
+    return os.path.splitext(file_name)[0] + log_ext
+
+
+def measure_lock(key):
+    with _locks_lock:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def json_default(value):
+    # Для json.dumps: массивы и числа numpy в списки и числа
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def split_std(item):
+    # (item без average.y_std, y_std или None): СКО по точкам хранится массивом рядом с трассой, а не текстом в JSON
+    average = item.get('average')
+    if not isinstance(average, dict) or 'y_std' not in average:
+        return item, None
+    item = dict(item, average={key: average[key] for key in average if key != 'y_std'})
+    return item, average['y_std']
+
+
+def split_arrays(data, dtype=trace_dtype):
+    # Словарь измерения -> (параметры без трасс, массивы)
+    data, y_std = split_std(data)
+    meta = {key: data[key] for key in data if key not in ('x', 'y_res', 'y_samples')}
+    arrays = {}
+    if 'x' in data:
+        arrays['x'] = np.asarray(data['x'], dtype=np.float64)
+    arrays['y_res'] = np.asarray(data['y_res'], dtype=dtype)
+    if y_std is not None:
+        arrays['y_res_std'] = np.asarray(y_std, dtype=dtype)
+    meta['y_samples'] = {}
+    rows = []
+    std_rows = []
+    for i in data.get('y_samples', {}):
+        item, y_std = split_std(data['y_samples'][i])
+        sample = {key: item[key] for key in item if key != 'y_res'}
+        sample['row'] = len(rows)
+        rows.append(np.asarray(item['y_res'], dtype=dtype))
+        if y_std is not None:
+            sample['std_row'] = len(std_rows)
+            std_rows.append(np.asarray(y_std, dtype=dtype))
+        meta['y_samples'][str(i)] = sample
+    arrays['samples'] = np.array(rows, dtype=dtype).reshape(len(rows), -1 if rows else len(arrays['y_res']))
+    if std_rows:
+        arrays['samples_std'] = np.array(std_rows, dtype=dtype)
+    return meta, arrays
+
+
+def write_file(file_name, meta, arrays):
+    # Запись во временный файл и замена: читатели видят либо старый, либо новый файл целиком
+    table = {}
+    offset = 0
+    for name in arrays:
+        table[name] = {'offset': offset, 'dtype': arrays[name].dtype.str, 'shape': list(arrays[name].shape)}
+        offset += -(-arrays[name].nbytes // align) * align
+    meta = dict(meta, arrays=table)
+    meta_raw = json.dumps(meta, default=json_default).encode()
+    data_offset = -(-(header.size + len(meta_raw)) // align) * align
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    tmp = file_name + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(header.pack(magic, len(meta_raw), data_offset))
+        file.write(meta_raw)
+        for name in arrays:
+            file.seek(data_offset + table[name]['offset'])
+            file.write(np.ascontiguousarray(arrays[name]).tobytes())
+    os.replace(tmp, file_name)
+
+
+class Measure():
+    # Открытие читает только заголовок и JSON; массивы отображаются в память при первом обращении
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as file:
+            mark, meta_len, self.data_offset = header.unpack(file.read(header.size))
+            if mark != magic:
+                raise ValueError(f"{file_name} - не файл измерения")
+            self.meta = json.loads(file.read(meta_len))
+        self.table = self.meta.pop('arrays')
+
+    def names(self):
+        return list(self.table)
+
+    def array(self, name):
+        item = self.table[name]
+        shape = tuple(item['shape'])
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=item['dtype'])
+        return np.memmap(self.file_name, dtype=item['dtype'], mode='r', offset=self.data_offset + item['offset'], shape=shape)
+
+    def load(self, arrays=True):
+        # Словарь в прежнем формате; массивы копируются, чтобы файл можно было сразу перезаписать
+        data = json.loads(json.dumps(self.meta))
+        if not arrays:
+            for i in data['y_samples']:
+                data['y_samples'][i].pop('row')
+                data['y_samples'][i].pop('std_row', None)
+            return data
+        if 'x' in self.table:
+            data['x'] = np.array(self.array('x'))
+        data['y_res'] = np.array(self.array('y_res'), dtype=np.float64)
+        if 'y_res_std' in self.table:
+            data['average']['y_std'] = np.array(self.array('y_res_std'), dtype=np.float64)
+        samples = self.array('samples')
+        samples_std = self.array('samples_std') if 'samples_std' in self.table else None
+        for i in data['y_samples']:
+            sample = data['y_samples'][i]
+            sample['y_res'] = np.array(samples[sample.pop('row')], dtype=np.float64)
+            if 'std_row' in sample:
+                sample['average']['y_std'] = np.array(samples_std[sample.pop('std_row')], dtype=np.float64)
+        return data
+
+
+def open_measure(key):
+    return Measure(measure_file(key))
+
+
+def load_measure(key, arrays=True):
+    # Согласованный вид: файл измерения плюс все целые записи журнала
+    if os.path.exists(measure_file(key)):
+        return read_measure_file(measure_file(key), arrays)
+    return read_measure_file(legacy_file(key), arrays)
+
+
+def save_measure(key, data, dtype=trace_dtype):
+    # Полная запись измерения; журнал после неё не нужен
+    with measure_lock(key):
+        meta, arrays = split_arrays(data, dtype)
+        write_file(measure_file(key), meta, arrays)
+        if os.path.exists(log_file(measure_file(key))):
+            os.remove(log_file(measure_file(key)))
+
+
+def read_measure_file(file_name, arrays=True):
+    # Любой файл измерения по пути: двоичный или старый JSON, с журналом рядом
+    if file_name.endswith(measure_ext):
+        data = Measure(file_name).load(arrays)
+    else:
+        with open(file_name) as file:
+            data = json.load(file)
+    apply_log(data, log_file(file_name), arrays)
+    return data
+
+
+def read_log(file_name, arrays=True):
+    # Записи журнала по порядку; недописанная последняя запись (сбой при записи) пропускается
+    if not os.path.exists(file_name):
+        return
+    with open(file_name, 'rb') as file:
+        while True:
+            head = file.read(log_header.size)
+            if len(head) < log_header.size:
+                return
+            mark, meta_len, n = log_header.unpack(head)
+            if mark != log_magic:
+                raise ValueError(f"Повреждённая запись журнала в {file_name}")
+            meta_raw = file.read(meta_len)
+            if len(meta_raw) < meta_len:
+                return
+            if arrays:
+                trace_raw = file.read(8 * n)
+                if len(trace_raw) < 8 * n:
+                    return
+                trace = np.frombuffer(trace_raw, dtype='<f8').copy()
+            else:
+                position = file.tell()
+                if file.seek(0, 2) < position + 8 * n:
+                    return
+                file.seek(position + 8 * n)
+                trace = None
+            yield json.loads(meta_raw), trace
+
+
+def apply_log(data, file_name, arrays=True):
+    for record, trace in read_log(file_name, arrays):
+        if record['type'] == 'sample':
+            sample = dict(record['fields'])
+            if arrays:
+                # За трассой в той же записи - average.y_std (record['std'] точек)
+                std = record.get('std', 0)
+                sample['y_res'] = trace[:len(trace) - std]
+                if std:
+                    sample['average'] = dict(sample['average'], y_std=trace[len(trace) - std:])
+            data['y_samples'][record['sample']] = sample
+        else:
+            # '' - поля самого измерения, иначе номер образца
+            for i in record['updates']:
+                target = data if i == '' else data['y_samples'][i]
+                target.update(record['updates'][i])
+    return data
+
+
+def repair_log(file_name):
+    # Обрезка недописанной последней записи после сбоя, иначе новые записи окажутся за ней и не будут прочитаны
+    if not os.path.exists(file_name):
+        return
+    good = 0
+    with open(file_name, 'rb') as file:
+        size = file.seek(0, 2)
+        while good + log_header.size <= size:
+            file.seek(good)
+            mark, meta_len, n = log_header.unpack(file.read(log_header.size))
+            if mark != log_magic or good + log_header.size + meta_len + 8 * n > size:
+                break
+            good += log_header.size + meta_len + 8 * n
+    if good < size:
+        with open(file_name, 'r+b') as file:
+            file.truncate(good)
+
+
+def append_record(key, record, trace=None):
+    # Одна запись - один write в конец журнала; время не зависит от числа образцов
+    trace_raw = b'' if trace is None else np.asarray(trace, dtype='<f8').tobytes()
+    meta_raw = json.dumps(record, default=json_default).encode()
+    with measure_lock(key):
+        if key not in _checked:
+            repair_log(log_file(measure_file(key)))
+            _checked.add(key)
+        with open(log_file(measure_file(key)), 'ab') as file:
+            file.write(log_header.pack(log_magic, len(meta_raw), len(trace_raw) // 8) + meta_raw + trace_raw)
+        size = os.path.getsize(log_file(measure_file(key)))
+    if size > log_compact_bytes:
+        compact(key)
+
+
+def append_sample(key, sample_id, sample):
+    sample, y_std = split_std(sample)
+    fields = {name: sample[name] for name in sample if name != 'y_res'}
+    record = {'type': 'sample', 'sample': str(sample_id), 'fields': fields}
+    trace = np.asarray(sample['y_res'], dtype=np.float64)
+    if y_std is not None:
+        record['std'] = len(y_std)
+        trace = np.concatenate([trace, np.asarray(y_std, dtype=np.float64)])
+    append_record(key, record, trace)
+
+
+def append_updates(key, updates):
+    # updates - {номер образца: поля} ('' - поля измерения); все поля одного расчёта в одной записи
+    append_record(key, {'type': 'update', 'updates': {str(i): updates[i] for i in updates}})
+
+
+def compact(key):
+    # Свёртка журнала в файл измерения (старый JSON при этом переходит в двоичный формат)
+    with measure_lock(key):
+        data = load_measure(key)
+        meta, arrays = split_arrays(data)
+        write_file(measure_file(key), meta, arrays)
+        if os.path.exists(log_file(measure_file(key))):
+            os.remove(log_file(measure_file(key)))
+        # Старый JSON теперь устарел: migrate() не должен перезаписать им свёрнутый файл
+        if os.path.exists(legacy_file(key)):
+            os.remove(legacy_file(key))
+
+
+def migrate(file_names, dtype=trace_dtype, remove=False):
+    # Перенос JSON-измерений в двоичные файлы рядом с исходными (<имя>.fms) с проверкой чтением
+    arr_report = {}
+    for file_name in file_names:
+        target = os.path.splitext(file_name)[0] + measure_ext
+        if os.path.exists(target):
+            # Уже перенесён (или свёрнут из журнала) - двоичный файл новее JSON
+            arr_report[file_name] = 'skip: уже есть ' + target
+            continue
+        try:
+            with open(file_name) as file:
+                data = json.load(file)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            arr_report[file_name] = 'skip: не JSON'
+            continue
+        if not isinstance(data, dict) or 'y_res' not in data:
+            arr_report[file_name] = 'skip: не измерение'
+            continue
+        meta, arrays = split_arrays(data, dtype)
+        write_file(target, meta, arrays)
+        check = Measure(target).load()
+        same = np.allclose(check['y_res'], np.asarray(data['y_res'], dtype=np.float64), rtol=1e-6 if dtype == np.float32 else 0)
+        same = same and list(check['y_samples']) == [str(i) for i in data['y_samples']]
+        arr_report[file_name] = target if same else 'error: не совпадает после чтения'
+        if same and remove:
+            os.remove(file_name)
+    return arr_report
+
+
+def legacy_files():
+    # Все JSON-измерения проекта: data_ferro/, примеры в data_base/ и r_data.txt
+    return sorted(glob.glob(measure_dir + '/*.txt')) + sorted(glob.glob('data_base/*.txt')) + (['r_data.txt'] if os.path.exists('r_data.txt') else [])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Перенос JSON-измерений в двоичный формат')
+    parser.add_argument('files', nargs='*', help='по умолчанию data_ferro/*.txt, data_base/*.txt, r_data.txt')
+    parser.add_argument('--float32', action='store_true', help='хранить трассы в float32')
+    parser.add_argument('--remove', action='store_true', help='удалить JSON после успешного переноса')
+    args = parser.parse_args()
+    report = migrate(args.files or legacy_files(), np.float32 if args.float32 else trace_dtype, args.remove)
+    for file_name in report:
+        print("{:50}".format(file_name) + "{:>40}".format(report[file_name]))
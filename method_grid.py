@@ -0,0 +1,100 @@
+import argparse
+import inspect
+import numpy as np
+import pandas as pd
+from uncertainty import batch_methods
+
+# Расчёт метода на декартовой сетке входов (подбор резонатора, толщины образца): одна сетка - один вызов метода
+grid_E = {'1': (1.2, 200), '2': (1.2, 200), '3': (1.2, 20), '4': (1.2, 200)} # Допустимые E по методам (Марина проверяет E/3.2 <= 20)
+grid_tgo = (5 * 10**-5, 10**-2) # Допустимые tgo
+method_names = {'Methot_Vlad': '1', 'Methot_Nikita': '2', 'Methot_Marina': '3', 'Method_real': '4'}
+
+
+def method_params(method):
+    # Имена входов метода по порядку аргументов
+    func, kinds = batch_methods[method_names.get(method, method)]
+    return list(inspect.signature(func).parameters)
+
+
+def method_grid(method, axes, fixed):
+    # axes - {имя входа: значения} (оси сетки по порядку), fixed - {имя входа: число}
+    method = method_names.get(method, method)
+    func, kinds = batch_methods[method]
+    params = method_params(method)
+    missing = [name for name in params if name not in axes and name not in fixed]
+    if missing:
+        raise ValueError(f"Не заданы входы {missing}")
+    dims = list(axes)
+    coords = {name: np.asarray(axes[name], dtype=np.float64).ravel() for name in dims}
+    # Каждая ось получает своё измерение, остальные единичные: массивы сетки не создаются до вызова метода
+    args = []
+    for name in params:
+        if name in coords:
+            shape = [1] * len(dims)
+            shape[dims.index(name)] = len(coords[name])
+            args.append(coords[name].reshape(shape))
+        else:
+            args.append(float(fixed[name]))
+    result = func(*args)
+    shape = tuple(len(coords[name]) for name in dims)
+    E = np.broadcast_to(result['E'], shape)
+    tgo = np.broadcast_to(result['tgo'], shape)
+    with np.errstate(invalid='ignore'):
+        E_ok = (grid_E[method][0] <= E) & (E <= grid_E[method][1])
+        tgo_ok = (grid_tgo[0] <= tgo) & (tgo <= grid_tgo[1])
+    valid = np.broadcast_to(result['valid'], shape) & E_ok & tgo_ok
+    return {'method': method, 'dims': dims, 'coords': coords, 'E': E, 'tgo': tgo, 'E_ok': E_ok, 'tgo_ok': tgo_ok, 'valid': valid}
+
+
+def fail_regions(grid):
+    # Где сетка не проходит проверки: доля отказов по каждому значению каждой оси и границы годной области
+    dims = grid['dims']
+    arr_region = {'valid_share': float(grid['valid'].mean()), 'E_fail_share': float(1 - grid['E_ok'].mean()),
+                  'tgo_fail_share': float(1 - grid['tgo_ok'].mean()), 'axes': {}}
+    for j, name in enumerate(dims):
+        other = tuple(k for k in range(len(dims)) if k != j)
+        fail = 1 - grid['valid'].mean(axis=other) if other else 1 - grid['valid'].astype(np.float64)
+        ok = np.flatnonzero(fail < 1)
+        arr_region['axes'][name] = {
+            'fail_share': fail,
+            'valid_range': [float(grid['coords'][name][ok].min()), float(grid['coords'][name][ok].max())] if len(ok) else None,
+        }
+    return arr_region
+
+
+def grid_frame(grid):
+    # Таблица с осями сетки в индексе (для выгрузки и сводных таблиц)
+    index = pd.MultiIndex.from_product([grid['coords'][name] for name in grid['dims']], names=grid['dims'])
+    return pd.DataFrame({name: np.ravel(grid[name]) for name in ('E', 'tgo', 'E_ok', 'tgo_ok', 'valid')}, index=index)
+
+
+def parse_axis(text):
+    # "t=0.5:2:50" - 50 точек от 0.5 до 2; "t=0.5,1,1.5" - список значений
+    name, values = text.split('=', 1)
+    if ':' in values:
+        start, stop, num = values.split(':')
+        return name, np.linspace(float(start), float(stop), int(num))
+    return name, np.array([float(v) for v in values.split(',')])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Расчёт метода на сетке входов')
+    parser.add_argument('method', help='1-4 или имя метода (Methot_Nikita, Method_real, ...)')
+    parser.add_argument('--axis', action='append', default=[], help='ось сетки: имя=начало:конец:точек или имя=v1,v2,...')
+    parser.add_argument('--set', action='append', default=[], help='постоянный вход: имя=значение')
+    parser.add_argument('--csv', help='сохранить таблицу сетки')
+    args = parser.parse_args()
+
+    axes = dict(parse_axis(text) for text in args.axis)
+    fixed = {name: float(value) for name, value in (text.split('=', 1) for text in args.set)}
+    grid = method_grid(args.method, axes, fixed)
+    region = fail_regions(grid)
+    print("{:30}".format("Inputs") + "{:>40}".format(', '.join(method_params(args.method))))
+    print("{:30}".format("Grid points") + "{:>40}".format(grid['valid'].size))
+    print("{:30}".format("Valid share") + "{:>40}".format(f"{region['valid_share']:.4f}"))
+    print("{:30}".format("E out of range") + "{:>40}".format(f"{region['E_fail_share']:.4f}"))
+    print("{:30}".format("tgo out of range") + "{:>40}".format(f"{region['tgo_fail_share']:.4f}"))
+    for name in region['axes']:
+        print("{:30}".format("Valid " + name) + "{:>40}".format(str(region['axes'][name]['valid_range'])))
+    if args.csv:
+        grid_frame(grid).to_csv(args.csv)
@@ -0,0 +1,241 @@
+import functools
+import numpy as np
+from scipy.special import jv, yn
+from All_Methods_3 import EB, v11, c, p
+
+# Варианты методов для массивов: все образцы (или целый архив) считаются одним вызовом numpy
+solve_iter = 60 # Предел итераций Ньютона с делением пополам
+solve_tol = 1e-13
+marina_points = 4097 # Узлов в таблице обратной функции для уравнения Марины
+marina_polish = 1 # Шагов Ньютона после интерполяции по таблице
+marina_cache_points = 4096 # Кэшируются только небольшие наборы образцов (сетки и Монте-Карло считаются заново)
+marina_edge = 5.135622301840683 # Первый ноль J2: здесь jv(1,x)/(x*jv(0,x)) снова равно 1/2
+
+
+def tan_branch(drob):
+    # Ветвь наименьшего положительного корня tg(x)/x + drob = 0
+    drob = np.asarray(drob, dtype=np.float64)
+    lo = np.where(drob < -1, 0, np.where(drob > 0, np.pi / 2, np.pi))
+    hi = np.where(drob < -1, np.pi / 2, np.where(drob > 0, np.pi, 1.5 * np.pi))
+    return lo, hi
+
+
+def solve_tan(drob):
+    # tg(x)/x + drob = 0 в виде g(x) = sin(x) + drob * x * cos(x) = 0 (без полюсов tg) на отрезке ветви
+    drob = np.asarray(drob, dtype=np.float64)
+    shape = drob.shape
+    drob = drob.ravel()
+    lo, hi = tan_branch(drob)
+    # Знак g у левого края ветви: отрицательный при drob < -1, иначе положительный
+    s_lo = np.where(drob < -1, -1, 1)
+    x = np.where(drob == 0, np.pi, 0.5 * (lo + hi))
+    # Итерации идут только по ещё не сошедшимся элементам
+    active = np.flatnonzero(np.isfinite(drob) & (drob != 0))
+    for i in range(solve_iter):
+        if len(active) == 0:
+            break
+        xa = x[active]
+        da = drob[active]
+        g = np.sin(xa) + da * xa * np.cos(xa)
+        dg = (1 + da) * np.cos(xa) - da * xa * np.sin(xa)
+        # Сужение отрезка по знаку g
+        left = np.sign(g) == s_lo[active]
+        lo_a = np.where(left, xa, lo[active])
+        hi_a = np.where(left, hi[active], xa)
+        lo[active] = lo_a
+        hi[active] = hi_a
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_new = xa - g / dg
+        # Шаг Ньютона вне отрезка заменяется делением пополам
+        bad = ~np.isfinite(x_new) | (x_new < lo_a) | (x_new > hi_a)
+        x_new = np.where(bad, 0.5 * (lo_a + hi_a), x_new)
+        x_new = np.where(g == 0, xa, x_new)
+        x[active] = x_new
+        active = active[(np.abs(x_new - xa) > solve_tol * np.maximum(np.abs(xa), 1)) & (g != 0)]
+    return np.where(np.isfinite(drob), x, np.nan).reshape(shape)
+
+
+def range_checks(f0, D, t, E, tgo, E_max=200):
+    # Те же проверки, что в скалярных методах: частота, размеры, E и tgo
+    return (8 * 10**9 <= f0) & (f0 <= 12 * 10**9) & (D > t) & (1.2 <= E) & (E <= E_max) & (5 * 10**-5 <= tgo) & (tgo <= 10**-2)
+
+
+def Methot_Vlad_batch(t, D, f0, f1, f2, fE, L0, delL, A0, AE):
+    t, D, f0, f1, f2, fE, L0, delL, A0, AE = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (t, D, f0, f1, f2, fE, L0, delL, A0, AE)])
+    a = 0.5 * D
+    k2 = 2 * np.pi * f0 * np.sqrt(EB) / c
+    with np.errstate(invalid='ignore', divide='ignore'):
+        h2 = np.sqrt(k2 ** 2 - (v11 / a) ** 2)
+        drob = np.tan(h2 * (delL + t)) / (h2 * t)
+        x = solve_tan(drob)
+
+        E = (c / (2 * np.pi * f0)) ** 2 * ((x / t) ** 2 + (v11 / a) ** 2)
+
+        LE = L0 - delL
+        F1 = 1 - (np.sin(2 * x) / (2 * x))
+        F2 = 1 - ((np.sin(2 * h2 * (LE - t))) / (2 * h2 * (LE - t)))
+        ksi = np.sin(x) ** 2 / np.sin(h2 * (LE - t)) ** 2
+        K1E = 1 / (1 + (ksi * (LE - t) * F2) / (E * t * F1))
+
+        G = a * L0 / ((2 * a - L0) * ((p * c) / (2 * L0 * f0 * np.sqrt(EB))) ** 2 + L0)
+        nu = G * (v11 / k2 * a) ** 2 * ((x / v11) ** 2 * (a / t) ** 2 + ((F1 * t) / a) + ksi * (((h2 * a) / v11) ** 2 + ((LE - t) * F2) / a) / E * t * F1 + ksi * (LE - t) * F2)
+
+        Q0 = f0 / (f2 - f1)
+        QE = fE / (f2 - f1)
+        Q00 = Q0 / (1 - 10 ** (0.05 * A0))
+        Q0E = QE / (1 - 10 ** (0.05 * AE))
+
+        tgo = (1 / K1E) * ((1 / Q0E) - (nu / Q00))
+    return {"status": "ok", "E": E, "tgo": tgo, "valid": range_checks(f0, D, t, E, tgo)}
+
+
+def Methot_Nikita_batch(t, D, L0, f0, f1, f2, fE, A0, AE):
+    t, D, L0, f0, f1, f2, fE, A0, AE = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (t, D, L0, f0, f1, f2, fE, A0, AE)])
+    a = 0.5 * D
+    k2 = 2 * np.pi * fE * np.sqrt(EB) / c
+    with np.errstate(invalid='ignore', divide='ignore'):
+        h2 = np.sqrt(k2 ** 2 - (v11 / a) ** 2)
+        drob = (np.tan(h2 * (L0 + t))) / (h2 * t)
+        x = solve_tan(drob)
+
+        E = (c / (2 * np.pi * fE)) ** 2 * ((x / t) ** 2 + (v11 / a) ** 2)
+
+        Q0 = f0 / (f2 - f1)
+        QE = fE / (f2 - f1)
+        Q00 = Q0 / (1 - 10 ** (0.05 * A0))
+        Q0E = QE / (1 - 10 ** (0.05 * AE))
+        ksi = np.sin(x) ** 2 / np.sin(h2 * (L0 - t)) ** 2
+        F1 = 1 - np.sin(2 * x) / (2 * x)
+        F2 = 1 - np.sin(2 * h2 * (L0 - t)) / (2 * h2 * (L0 - t))
+        K1E = 1 / (1 + (ksi * (L0 - t) * F2) / (E * t * F1))
+        G = a * L0 / ((2 * a - L0) * ((p * c) / (2 * L0 * f0 * np.sqrt(EB))) ** 2 + L0)
+
+        nu1 = G * np.sqrt(f0 / fE) * (v11 / (k2 * a)) ** 2
+        nu2 = (x / v11) ** 2 * (a / t) ** 2 + (t * F1) / a + ksi * ((h2 * a / v11) ** 2 + ((L0 - t) * F2) / a)
+        nu3 = E * t * F1 + ksi * (L0 - t) * F2
+        nu = nu1 * nu2 / nu3
+        tgo = (1 / K1E) * (1 / Q0E - nu / Q00)
+    return {"status": "ok", "E": E, "tgo": tgo, "valid": range_checks(f0, D, t, E, tgo)}
+
+
+@functools.lru_cache(maxsize=None)
+def marina_table(points=marina_points):
+    # jv(1,x)/(x*jv(0,x)) = drobZ <=> угол вектора (x*J0, J1) равен arctg(drobZ) (с точностью до пи).
+    # На (0, marina_edge) угол монотонно растёт от arctg(1/2) до пи + arctg(1/2): это ветвь наименьшего корня
+    x = np.linspace(0, marina_edge, points)[1:]
+    phi = np.unwrap(np.arctan2(jv(1, x), x * jv(0, x)))
+    return phi, x
+
+
+def solve_marina(drobZ):
+    # Наименьший положительный корень jv(1,x)/(x*jv(0,x)) = drobZ: таблица + шаг Ньютона без полюсов
+    drobZ = np.asarray(drobZ, dtype=np.float64)
+    phi_table, x_table = marina_table()
+    phi = np.arctan(drobZ)
+    phi = np.where(drobZ < 0.5, phi + np.pi, phi)
+    x = np.interp(phi, phi_table, x_table)
+    s = np.sin(phi)
+    co = np.cos(phi)
+    for i in range(marina_polish):
+        J0 = jv(0, x)
+        J1 = jv(1, x)
+        g = J1 * co - x * J0 * s
+        dg = (J0 - J1 / x) * co - (J0 - x * J1) * s
+        x = x - g / dg
+    return np.where(np.isfinite(drobZ), x, np.nan)
+
+
+def bessel_terms(y, b):
+    # Функции Бесселя, зависящие только от y и b (каждая считается один раз)
+    J1_yb = jv(1, y * b)
+    N1_yb = yn(1, y * b)
+    ratio = J1_yb / N1_yb
+    Z0_y = jv(0, y) - ratio * yn(0, y)
+    Z1_y = jv(1, y) - ratio * yn(1, y)
+    Z2_y = jv(2, y) - ratio * yn(2, y)
+    Z0_yb = jv(0, y * b) - (jv(0, y * b ** 2) / yn(0, y * b ** 2)) * yn(0, y * b)
+    return Z0_y, Z1_y, Z2_y, Z0_yb
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_terms(y_raw, shape, b):
+    return bessel_terms(np.frombuffer(y_raw, dtype=np.float64).reshape(shape), b)
+
+
+def marina_terms(y, b):
+    # При одной геометрии (b общее) повторный расчёт того же измерения берёт значения из кэша
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if b.size and y.size <= marina_cache_points and np.all(b == b.flat[0]):
+        return _cached_terms(y.tobytes(), y.shape, float(b.flat[0]))
+    return bessel_terms(y, b)
+
+
+def Methot_Marina_batch(a, f0, f1, f2, fE, R0, L, A0, AE, Q0, QE):
+    a, f0, f1, f2, fE, R0, L, A0, AE, Q0, QE = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (a, f0, f1, f2, fE, R0, L, A0, AE, Q0, QE)])
+    D = 2 * R0
+    d = 2 * a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        k2 = 2 * np.pi * fE * np.sqrt(EB) / c
+        h = p * np.pi / L
+        y = np.sqrt((k2 * a) ** 2 - (h * a) ** 2)
+        b = D / d
+        Z0_y, Z1_y, Z2_y, Z0_yb = marina_terms(y, b)
+
+        drobZ = Z1_y / (y * Z0_y)
+        x = solve_marina(drobZ)
+
+        E = (x ** 2 + (h * a) ** 2) / (k2 * a) ** 2
+        E_NEW = E / 3.2
+
+        k1 = 2 * np.pi * fE * np.sqrt(E) / c
+        Q00 = Q0 / (1 - 10 ** (0.05 * A0))
+        Q0E = QE / (1 - 10 ** (0.05 * AE))
+
+        J0_x = jv(0, x)
+        J1_x = jv(1, x)
+        J2_x = jv(2, x)
+        Jx = J1_x ** 2 - J0_x * J2_x
+        Zy = Z1_y ** 2 - Z0_y * Z2_y
+        ratio_x = (J0_x / Z0_y) ** 2
+        side = b ** 2 * Z0_yb ** 2 - Zy
+
+        drob_K1E = ((k2 * a) / y) ** 2 * ratio_x * side / (((k1 * a) / x) ** 2 * Jx)
+        K1E = 1 / (1 + drob_K1E)
+
+        chisl_n = (f0 / fE) ** 1.5 * ((D ** 2 * L) / a ** 2) * ratio_x * Z0_yb ** 2 + ((h * a) / x) ** 2 * Jx + ((h * a) / y) ** 2 * ratio_x * side
+        znam_n = 4 * ((D - L) * ((p * c) / (2 * L * f0 * np.sqrt(EB))) ** 2 + L) * (((k1 * a) / x) ** 2 * Jx + ((k2 * a) / y) ** 2 * ratio_x * side)
+        n = chisl_n / znam_n
+
+        tgo = (1 / K1E) * ((1 / Q0E) - (n / Q00))
+    # Проверки скалярного метода: диаметр образца, частота, E / 3.2 и tgo
+    valid = (3 <= d) & (d <= 13) & range_checks(f0, D, 0, E_NEW, tgo, 20)
+    return {"status": "ok", "E": E_NEW, "tgo": tgo, "valid": valid}
+
+
+def Method_real_batch(fe, f0, f10, f20, f1e, f2e, R, r):
+    fe, f0, f10, f20, f1e, f2e, R, r = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (fe, f0, f10, f20, f1e, f2e, R, r)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delF0 = (f0 - fe) / f0
+        mu = 1.05
+        e_real = 1.085 * (1 + (((0.539 * (R ** 2 / r ** 2) * delF0) / 1 - delF0) + (1.7 - 2.5 * delF0) * delF0) / (1 + (1.7 - 2.5 * delF0) * delF0 + 0.39 * mu * delF0 * (1 - delF0)))
+        K = 1.5
+        d0 = (2 * np.abs(f10 - f20)) / (f10 + f20)
+
+        dx = (2 * np.abs(f1e - f2e)) / (f1e + f2e)
+        d0s = d0 / (1 + K)
+        delD = dx - d0s
+        rR = r ** 2 / R ** 2
+        side = 1 + e_real * mu * 1.55 * rR * (1 - 1.53 * delF0)
+        e_image = ((0.2726 * (R ** 2 / r ** 2) * delD) / ((1 - delF0) ** 2 * (1 + delF0 * (0.486 + 1.56 * np.log(R / (2.14 * r)))) ** 2) * side) + ((e_real * 1.56 * rR * (1 - 1.53 * delF0) * (mu - 1) + e_real - 1) / side) * delD
+        tgo = e_image / e_real
+    return {"status": "ok", "E": e_real, "tgo": tgo, "valid": np.isfinite(e_real) & np.isfinite(tgo)}
+
+
+def batch_row(result, k):
+    # Результат k-го образца в формате скалярных методов; nan и inf (ниже отсечки, корень не найден) - ошибка, а не результат
+    E = float(result["E"][k])
+    tgo = float(result["tgo"][k])
+    if not (np.isfinite(E) and np.isfinite(tgo)):
+        return {"status": "error", "text_error": f"Метод не дал конечного результата: E = {E}, tgo = {tgo}"}
+    return {"status": result["status"], "E": E, "tgo": tgo}
@@ -0,0 +1,101 @@
+import numpy as np
+from scipy.signal import savgol_filter
+
+# Предобработка трасс перед поиском резонанса: цепочка этапов над массивом (трассы x точки).
+# Сырые трассы хранятся как есть, этапы применяются при каждом расчёте и записываются в файл измерения
+method_pipeline = {'1': [], '2': [], '3': [], '4': []} # Цепочка по умолчанию для каждого метода
+
+# Параметры этапов по умолчанию
+stage_defaults = {
+    'outlier': {'k': 6, 'floor': 1}, # Выбросы: отклонение от соседей больше k СКО шума и больше floor дБ
+    'savgol': {'window': 7, 'order': 2}, # Сглаживание Савицкого-Голея
+    'slope': {'edge': 0.1}, # Снятие наклона по краям трассы (доля точек с каждого края), уровень сохраняется
+    'baseline': {'edge': 0.1}, # Вычитание линии по краям трассы: уровень отсчитывается от фона
+}
+
+
+def outlier(arr_x, arr_2d, k, floor):
+    # Точка сравнивается с кубикой через соседей j-2, j-1, j+1, j+2: настоящий провал ею описывается, одиночный выброс - нет
+    if arr_2d.shape[1] < 5:
+        return arr_2d
+    pred = (-arr_2d[:, :-4] + 4 * arr_2d[:, 1:-3] + 4 * arr_2d[:, 3:-1] - arr_2d[:, 4:]) / 6
+    dev = arr_2d[:, 2:-2] - pred
+    # СКО шума по MAD отклонений (отклонение складывается из шума точки и шума предсказания)
+    sigma = 1.4826 * np.median(np.abs(dev), axis=1, keepdims=True) / np.sqrt(1 + 34 / 36)
+    # Соседи выброса лежат на гладкой кривой; у настоящего провала (даже в 2-3 точки) они сами сильно изогнуты.
+    # Провал уже шага сетки (одна точка) от выброса не отличить - для таких трасс этап не включать
+    shell = arr_2d[:, :-4] - arr_2d[:, 1:-3] - arr_2d[:, 3:-1] + arr_2d[:, 4:]
+    bad = (np.abs(dev) > np.maximum(k * sigma, floor)) & (np.abs(shell) < 0.5 * np.abs(dev))
+    result = arr_2d.copy()
+    result[:, 2:-2] = np.where(bad, pred, arr_2d[:, 2:-2])
+    return result
+
+
+def savgol(arr_x, arr_2d, window, order):
+    window = int(window) | 1
+    if arr_2d.shape[1] < window:
+        return arr_2d
+    return savgol_filter(arr_2d, window, int(order), axis=1, mode='interp')
+
+
+def edge_line(arr_x, arr_2d, edge):
+    # Прямая по краям каждой трассы (МНК одним вызовом для всех трасс)
+    n = arr_2d.shape[1]
+    m = max(int(n * edge), 1)
+    idx = np.r_[0:m, n - m:n]
+    u = arr_x[idx] - arr_x.mean()
+    slope, level = np.polyfit(u, arr_2d[:, idx].T, 1)
+    return slope[:, None] * (arr_x - arr_x.mean())[None, :], level[:, None]
+
+
+def slope(arr_x, arr_2d, edge):
+    tilt, level = edge_line(arr_x, arr_2d, edge)
+    return arr_2d - tilt
+
+
+def baseline(arr_x, arr_2d, edge):
+    tilt, level = edge_line(arr_x, arr_2d, edge)
+    return arr_2d - tilt - level
+
+
+stage_funcs = {'outlier': outlier, 'savgol': savgol, 'slope': slope, 'baseline': baseline}
+
+
+def parse_pipeline(spec):
+    # "outlier:6:1,savgol:11:3,slope" или список {'stage': ..., параметры} -> список этапов с полными параметрами
+    if not spec:
+        return []
+    if isinstance(spec, str):
+        items = []
+        for text in spec.split(','):
+            name, *values = text.strip().split(':')
+            items.append(dict(zip(stage_defaults[name], map(float, values)), stage=name))
+        spec = items
+    stages = []
+    for item in spec:
+        if item['stage'] not in stage_funcs:
+            raise ValueError(f"Неизвестный этап предобработки {item['stage']}")
+        stages.append(dict(stage_defaults[item['stage']], **item))
+    return stages
+
+
+def pipeline_for(data_param):
+    # Цепочка из data_param['preprocess'], иначе цепочка метода по умолчанию
+    if data_param.get('preprocess'):
+        return parse_pipeline(data_param['preprocess'])
+    return parse_pipeline(method_pipeline.get(data_param.get('method'), []))
+
+
+def prepare(arr_x, arr_y, stages):
+    # Трассы после всех этапов; форма входа сохраняется
+    if not stages:
+        return np.asarray(arr_y, dtype=np.float64)
+    arr_y = np.asarray(arr_y, dtype=np.float64)
+    arr_2d = np.atleast_2d(arr_y)
+    if arr_2d.size == 0:
+        return arr_y
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:arr_2d.shape[1]]
+    for item in stages:
+        params = {key: item[key] for key in item if key != 'stage'}
+        arr_2d = stage_funcs[item['stage']](arr_x, arr_2d, **params)
+    return arr_2d.reshape(arr_y.shape)
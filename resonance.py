@@ -0,0 +1,215 @@
+import numpy as np
+from scipy.signal import find_peaks
+
+# Поиск резонанса на массивах float64: одна трасса или сразу все трассы измерения (трассы x точки)
+res_window = 50 # Сколько точек слева и справа от минимума просматривать
+res_level = 3 # Уровень полосы над минимумом, дБ
+res_mode = 'fit' # Способ поиска для новых измерений: 'bin' или 'fit'
+res_prominence = 3 # Минимальная глубина провала относительно окружения, дБ
+
+
+def stack_traces(traces, points=None):
+    # Список трасс (строки или числа) -> массив (трассы x точки)
+    if not traces:
+        return np.empty((0, 0 if points is None else points))
+    return np.array([np.asarray(trace, dtype=np.float64)[:points] for trace in traces])
+
+
+def extract_resonance(arr_x, arr_y, window=res_window, level=res_level):
+    arr_y = np.asarray(arr_y, dtype=np.float64)
+    arr_2d = np.atleast_2d(arr_y)
+    n = arr_2d.shape[1]
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:n]
+    rows = np.arange(len(arr_2d))
+    idx = np.arange(n)
+    if len(arr_2d) == 0:
+        empty = np.empty(0)
+        return {'f0': empty, 'f1': empty, 'f2': empty, 'Q': empty, 'A0': empty, 'i0': rows, 'i1': rows, 'i2': rows}
+
+    i0 = arr_2d.argmin(axis=1)
+    A0 = arr_2d[rows, i0]
+    # Точки, ближайшие к уровню min + level, в окне слева [i0 - window, i0) и справа [i0, i0 + window)
+    dist = np.abs(arr_2d - (A0 + level)[:, None])
+    left = (idx >= (i0 - window)[:, None]) & (idx < i0[:, None])
+    right = (idx >= i0[:, None]) & (idx < (i0 + window)[:, None])
+    i1 = np.where(left, dist, np.inf).argmin(axis=1)
+    i2 = np.where(right, dist, np.inf).argmin(axis=1)
+
+    f0 = arr_x[i0]
+    f1 = arr_x[i1]
+    f2 = arr_x[i2]
+    with np.errstate(divide='ignore'):
+        Q = f0 / (f2 - f1)
+    result = {'f0': f0, 'f1': f1, 'f2': f2, 'Q': Q, 'A0': A0, 'i0': i0, 'i1': i1, 'i2': i2}
+    if arr_y.ndim == 1:
+        return resonance_row(result, 0)
+    return result
+
+
+def resonance_row(result, k):
+    # Результат для k-й трассы в виде словаря чисел
+    return {key: (int(result[key][k]) if key.startswith('i') else float(result[key][k])) for key in result}
+
+
+def DataArrDist(arr_x, arr_y):
+    return extract_resonance(arr_x, arr_y)
+
+
+def fit_resonance(arr_x, arr_y, level=res_level, window=res_window):
+    # Уточнение между точками сетки: вершина параболы по трём точкам у минимума (f0, A0)
+    # и линейная интерполяция пересечений уровня A0 + level на каждом склоне (f1, f2)
+    arr_y = np.asarray(arr_y, dtype=np.float64)
+    arr_2d = np.atleast_2d(arr_y)
+    n = arr_2d.shape[1]
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:n]
+    res = extract_resonance(arr_x, arr_2d, window, level)
+    if len(arr_2d) == 0 or n < 3:
+        return res if arr_y.ndim != 1 else resonance_row(res, 0)
+    rows = np.arange(len(arr_2d))
+    idx = np.arange(n)
+
+    i0 = res['i0']
+    im = np.clip(i0 - 1, 0, n - 1)
+    ip = np.clip(i0 + 1, 0, n - 1)
+    y_m = arr_2d[rows, im]
+    y_0 = arr_2d[rows, i0]
+    y_p = arr_2d[rows, ip]
+    denom = y_m - 2 * y_0 + y_p
+    inner = (i0 > 0) & (i0 < n - 1) & (denom > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(inner, 0.5 * (y_m - y_p) / denom, 0)
+    step = np.where(delta < 0, arr_x[i0] - arr_x[im], arr_x[ip] - arr_x[i0])
+    f0 = arr_x[i0] + delta * step
+    A0 = y_0 - 0.25 * (y_m - y_p) * delta
+
+    # Пересечения уровня: слева последний отрезок [j, j+1] с y[j] >= L > y[j+1], справа первый с y[j] < L <= y[j+1]
+    lev = (A0 + level)[:, None]
+    above = arr_2d >= lev
+    cross_l = above[:, :-1] & ~above[:, 1:] & (idx[:-1] < i0[:, None]) & (idx[:-1] >= (i0 - window)[:, None])
+    cross_r = ~above[:, :-1] & above[:, 1:] & (idx[:-1] >= i0[:, None]) & (idx[:-1] < (i0 + window)[:, None])
+    has_l = cross_l.any(axis=1)
+    has_r = cross_r.any(axis=1)
+    j1 = np.where(cross_l, idx[:-1], -1).max(axis=1).clip(0)
+    j2 = np.where(cross_r, idx[:-1], n).min(axis=1).clip(max=n - 2)
+    f1 = np.where(has_l, interpolate_level(arr_x, arr_2d, rows, j1, lev[:, 0]), res['f1'])
+    f2 = np.where(has_r, interpolate_level(arr_x, arr_2d, rows, j2, lev[:, 0]), res['f2'])
+    with np.errstate(divide='ignore'):
+        Q = f0 / (f2 - f1)
+    result = {'f0': f0, 'f1': f1, 'f2': f2, 'Q': Q, 'A0': A0, 'i0': i0,
+              'i1': np.where(has_l, j1, res['i1']), 'i2': np.where(has_r, j2 + 1, res['i2'])}
+    if arr_y.ndim == 1:
+        return resonance_row(result, 0)
+    return result
+
+
+def interpolate_level(arr_x, arr_2d, rows, j, lev):
+    y_a = arr_2d[rows, j]
+    y_b = arr_2d[rows, j + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(y_b != y_a, (lev - y_a) / (y_b - y_a), 0)
+    return arr_x[j] + t * (arr_x[j + 1] - arr_x[j])
+
+
+def find_resonance(arr_x, arr_y, mode=res_mode):
+    # 'bin' - по точкам сетки (как раньше), 'fit' - с уточнением между точками
+    if mode == 'fit':
+        return fit_resonance(arr_x, arr_y)
+    return extract_resonance(arr_x, arr_y)
+
+
+def find_dips(arr_x, arr_y, prominence=res_prominence, level=res_level, mode=res_mode):
+    # Все провалы глубже prominence во всех трассах; результат - плоские массивы по провалам с номером трассы 'trace'
+    arr_2d = np.atleast_2d(np.asarray(arr_y, dtype=np.float64))
+    n = arr_2d.shape[1]
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:n]
+    rows, i0, lo, hi, depth = [], [], [], [], []
+    for k in range(len(arr_2d)):
+        # Поиск вершин идёт в C по каждой трассе, всё остальное - одним проходом по всем провалам
+        peaks, props = find_peaks(-arr_2d[k], prominence=prominence)
+        rows.append(np.full(len(peaks), k))
+        i0.append(peaks)
+        lo.append(props['left_bases'])
+        hi.append(props['right_bases'])
+        depth.append(props['prominences'])
+    rows, i0, lo, hi = [np.concatenate(v).astype(np.intp) if v else np.empty(0, dtype=np.intp) for v in (rows, i0, lo, hi)]
+    depth = np.concatenate(depth) if depth else np.empty(0)
+    result = dip_params(arr_x, arr_2d, rows, i0, lo, hi, level, mode == 'fit')
+    result['trace'] = rows
+    result['depth'] = depth
+    return result
+
+
+def dip_params(arr_x, arr_2d, rows, i0, lo, hi, level, fit):
+    # f0, f1, f2, Q, A0 провалов (трасса rows, минимум i0, склоны до оснований lo и hi)
+    n = arr_2d.shape[1]
+    idx = np.arange(n)
+    A0 = arr_2d[rows, i0]
+    f0 = arr_x[i0]
+    if fit and n >= 3:
+        im = np.clip(i0 - 1, 0, n - 1)
+        ip = np.clip(i0 + 1, 0, n - 1)
+        y_m = arr_2d[rows, im]
+        y_p = arr_2d[rows, ip]
+        denom = y_m - 2 * A0 + y_p
+        inner = (i0 > 0) & (i0 < n - 1) & (denom > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(inner, 0.5 * (y_m - y_p) / denom, 0)
+        step = np.where(delta < 0, arr_x[i0] - arr_x[im], arr_x[ip] - arr_x[i0])
+        f0 = arr_x[i0] + delta * step
+        A0 = A0 - 0.25 * (y_m - y_p) * delta
+    lev = A0 + level
+    dips = arr_2d[rows]
+    above = dips >= lev[:, None]
+    cross_l = above[:, :-1] & ~above[:, 1:] & (idx[:-1] < i0[:, None]) & (idx[:-1] >= lo[:, None])
+    cross_r = ~above[:, :-1] & above[:, 1:] & (idx[:-1] >= i0[:, None]) & (idx[:-1] < hi[:, None])
+    has_l = cross_l.any(axis=1)
+    has_r = cross_r.any(axis=1)
+    j1 = np.where(cross_l, idx[:-1], -1).max(axis=1).clip(0) if n > 1 else np.zeros(len(rows), dtype=np.intp)
+    j2 = np.where(cross_r, idx[:-1], n).min(axis=1).clip(max=n - 2) if n > 1 else np.zeros(len(rows), dtype=np.intp)
+    if fit:
+        f1 = interpolate_level(arr_x, arr_2d, rows, j1, lev)
+        f2 = interpolate_level(arr_x, arr_2d, rows, j2, lev)
+    else:
+        # Ближайшая к уровню точка сетки на каждом склоне
+        f1 = np.where(np.abs(arr_2d[rows, j1] - lev) <= np.abs(arr_2d[rows, j1 + 1] - lev), arr_x[j1], arr_x[j1 + 1])
+        f2 = np.where(np.abs(arr_2d[rows, j2] - lev) <= np.abs(arr_2d[rows, j2 + 1] - lev), arr_x[j2], arr_x[j2 + 1])
+    # Склон не пересекает уровень до основания (мелкий или обрезанный провал) - граница по основанию
+    f1 = np.where(has_l, f1, arr_x[lo])
+    f2 = np.where(has_r, f2, arr_x[hi])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Q = f0 / (f2 - f1)
+    return {'f0': f0, 'f1': f1, 'f2': f2, 'Q': Q, 'A0': A0, 'i0': i0,
+            'i1': np.where(has_l, j1, lo), 'i2': np.where(has_r, j2 + 1, hi)}
+
+
+def select_dip(arr_x, arr_y, f_lo=None, f_hi=None, mode=res_mode, prominence=res_prominence):
+    # Резонанс нужной моды в каждой трассе: самый глубокий провал с f0 в окне [f_lo, f_hi].
+    # Трассы без такого провала - минимум внутри окна, как при поиске по части трассы
+    arr_2d = np.atleast_2d(np.asarray(arr_y, dtype=np.float64))
+    n = arr_2d.shape[1]
+    arr_x = np.asarray(arr_x, dtype=np.float64)[:n]
+    f_lo = arr_x[0] if f_lo is None else f_lo
+    f_hi = arr_x[-1] if f_hi is None else f_hi
+    lo_i = int(np.searchsorted(arr_x, f_lo, 'left'))
+    hi_i = int(np.searchsorted(arr_x, f_hi, 'right'))
+    if hi_i <= lo_i:
+        raise ValueError(f"Окно {f_lo} - {f_hi} вне оси {arr_x[0]} - {arr_x[-1]}")
+    result = find_resonance(arr_x[lo_i:hi_i], arr_2d[:, lo_i:hi_i], mode)
+    result = {key: np.array(result[key]) for key in result}
+    for key in ('i0', 'i1', 'i2'):
+        result[key] = result[key] + lo_i
+    result['depth'] = np.full(len(arr_2d), np.nan)
+    if len(arr_2d) == 0:
+        return result
+    dips = find_dips(arr_x, arr_2d, prominence, mode=mode)
+    inside = (dips['f0'] >= f_lo) & (dips['f0'] <= f_hi)
+    # Самый глубокий провал окна для каждой трассы: сортировка по (трасса, глубина), последний в группе
+    order = np.lexsort((dips['depth'][inside], dips['trace'][inside]))
+    trace = dips['trace'][inside][order]
+    last = np.flatnonzero(np.append(trace[1:] != trace[:-1], True)) if len(trace) else np.empty(0, dtype=np.intp)
+    pick = np.flatnonzero(inside)[order][last]
+    for key in result:
+        result[key][dips['trace'][pick]] = dips[key][pick]
+    if np.ndim(arr_y) == 1:
+        return resonance_row(result, 0)
+    return result
@@ -1,6 +1,7 @@
 import pyvisa
 import bisect
 import numpy as np
+from resonance import DataArrDist
 address = "TCPIP0::localhost::5025::SOCKET"
 
 # class Messager():
@@ -48,21 +49,6 @@ def take_closest_left(myList, myNumber):
         return before
 
 
-def closest_value(input_list, input_value):
-    arr = np.asarray(input_list)
-    i = (np.abs(arr - input_value)).argmin()
-    return arr[i]
-
-def DataArrDist(arr_x, arr_y):
-    float_list = [float(i) for i in arr_y]
-    index_res = float_list.index(min(float_list))
-    f0 = arr_x[index_res]
-    f1 = arr_x[float_list.index(closest_value(float_list[(index_res - 50):index_res], (min(float_list) + 3)))]
-    f2 = arr_x[float_list.index(closest_value(float_list[index_res:index_res + 50], (min(float_list) + 3)))]
-    Q = float(f0)/(float(f2)-float(f1))
-    return {'f0': f0, 'f1': f1, 'f2': f2, 'Q':Q}
-
-
 class Messager():
     def __init__(self):
         rm = pyvisa.ResourceManager()
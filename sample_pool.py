@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from axis_cache import measure_x
+from methods_batch import batch_row
+from resonance import find_resonance, select_dip, stack_traces
+from preprocess import prepare
+from measure_store import read_measure_file
+from uncertainty import run_method, monte_carlo, interval_row, freq_sigma, mc_draws
+
+# Расчёт образцов в пуле процессов: образцы делятся на части, части считаются параллельно, результаты собираются по порядку
+pool_workers = max((os.cpu_count() or 1) - 1, 1) # Процессов в пуле; 1 - считать в текущем процессе
+pool_chunk = 4 # Образцов на одну задачу
+pool_min_samples = 8 # Меньше образцов - считать в текущем процессе (запуск задач дороже расчёта)
+marina_window = (None, 10.5 * 10**9) # Окно моды образца-стержня, Гц (раньше - первые 500 точек трассы 8-12 ГГц); задаётся data[3][f_min], data[3][f_max]
+
+_pool = None
+
+
+def serial_only():
+    # Собранный exe (build_v1.spec) не может запускать дочерние процессы с тем же кодом
+    return getattr(sys, 'frozen', False) or pool_workers <= 1
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=pool_workers)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def slice_args(args, lo, hi):
+    # Массивы по образцам режутся, общие входы (числа) передаются как есть
+    return [np.asarray(v)[lo:hi] if np.ndim(v) else v for v in args]
+
+
+def sample_values(data, keys, name):
+    return np.array([float(data['y_samples'][i][name]) for i in keys], dtype=np.float64)
+
+
+def method_args(data, keys, arr_x):
+    # Входы метода измерения data['data_param']['method'] для образцов keys: общие - числа, по образцам - массивы
+    mode = data.get('res_mode', 'bin')
+    param = data['data_param']
+    # Резонансы всех образцов находятся одним вызовом, после записанной в файле предобработки
+    stages = data.get('preprocess', [])
+    arr_y = prepare(arr_x, stack_traces([data['y_samples'][i]['y_res'] for i in keys]), stages)
+    Res = find_resonance(arr_x, arr_y, mode)
+    match param['method']:
+        case '1':
+            return [float(param['data[1][t]']), float(param['data[1][d_res]']),
+                    float(data['f0']), float(data['f1']), float(data['f2']), sample_values(data, keys, 'fe'),
+                    float(param['data[1][h_res]']), float(param['data[1][del_L]']),
+                    float(data['A0']), sample_values(data, keys, 'AE')]
+        case '2':
+            return [float(param['data[2][t]']), float(param['data[2][d_res]']),
+                    float(param['data[2][h_res]']), float(data['f0']),
+                    float(data['f1']), float(data['f2']), Res['f0'],
+                    float(data['A0']), sample_values(data, keys, 'AE')]
+        case '3':
+            ResArr = find_resonance(arr_x, prepare(arr_x, data['y_res'], stages), mode)
+            f_min = float(param['data[3][f_min]']) if param.get('data[3][f_min]') else marina_window[0]
+            f_max = float(param['data[3][f_max]']) if param.get('data[3][f_max]') else marina_window[1]
+            # fE, AE и QE - все из провала в окне: fe и AE образца сняты по минимуму всей трассы и могут относиться к другой моде
+            ResCut = select_dip(arr_x, arr_y, f_min, f_max, mode)
+            return [float(param['data[3][d]']), float(data['f0']),
+                    float(data['f1']), float(data['f2']), ResCut['f0'],
+                    float(param['data[3][d_res]'])/2, float(param['data[3][h_res]']),
+                    float(data['A0']), ResCut['A0'], float(ResArr['Q']), ResCut['Q']]
+        case '4':
+            #arr_results = Methot_Egor(a, b, float(param['data[4][d_sample]']), float(param['data[4][d_res]']), f1, f1sh, deld, Ms, float(param['data[4][form]']))
+            return [Res['f0'], float(data['f0']), float(data['f1']), float(data['f2']), Res['f1'], Res['f2'],
+                    float(param['data[4][d_res]']), float(param['data[4][d_sample]'])]
+    raise ValueError(f"Неизвестный метод {param['method']}")
+
+
+def evaluate_chunk(method, args, sigma, draws, n):
+    # Результаты n образцов: {'status': 'ok', 'E', 'tgo', интервалы} или {'status': 'error', 'text_error'}
+    try:
+        Batch = run_method(method, args)
+        Unc = monte_carlo(method, args, sigma, draws) if draws else None
+        rows = []
+        for k in range(n):
+            arr_results = batch_row(Batch, k)
+            if Unc is not None and arr_results['status'] == 'ok':
+                arr_results.update(interval_row(Unc, k))
+            rows.append(arr_results)
+        return rows
+    except Exception:
+        if n == 1:
+            return [{'status': 'error', 'text_error': traceback.format_exc()}]
+        # Ошибка в части - каждый образец считается отдельно, чтобы найти виноватый
+        return [evaluate_chunk(method, slice_args(args, k, k + 1), sigma, draws, 1)[0] for k in range(n)]
+
+
+def evaluate_samples(method, args, n, sigma=None, draws=mc_draws):
+    # Список результатов по образцам в исходном порядке
+    if serial_only() or n < pool_min_samples:
+        return evaluate_chunk(method, args, sigma, draws, n)
+    bounds = [(lo, min(lo + pool_chunk, n)) for lo in range(0, n, pool_chunk)]
+    try:
+        pool = get_pool()
+        futures = [pool.submit(evaluate_chunk, method, slice_args(args, lo, hi), sigma, draws, hi - lo) for lo, hi in bounds]
+        rows = []
+        for (lo, hi), future in zip(bounds, futures):
+            try:
+                rows.extend(future.result())
+            except BrokenProcessPool:
+                raise
+            except Exception:
+                rows.extend({'status': 'error', 'text_error': traceback.format_exc()} for k in range(hi - lo))
+        return rows
+    except BrokenProcessPool:
+        # Пул сломан (процесс упал) - пересоздаётся при следующем вызове, сейчас считаем в текущем процессе
+        shutdown_pool()
+        return evaluate_chunk(method, args, sigma, draws, n)
+
+
+def reprocess(file_names):
+    # Повторный расчёт всех образцов сохранённых измерений (data_ferro/<id>.fms или .txt) без запуска приложения
+    arr_answer = {}
+    for file_name in file_names:
+        data = read_measure_file(file_name)
+        keys = list(data['y_samples'])
+        arr_x = measure_x(data)
+        try:
+            args = method_args(data, keys, arr_x)
+        except Exception:
+            arr_answer[file_name] = {'status': 'error', 'text_error': traceback.format_exc()}
+            continue
+        rows = evaluate_samples(data['data_param']['method'], args, len(keys), {'freq': freq_sigma(arr_x)})
+        arr_answer[file_name] = {data['y_samples'][i].get('name', i): row for i, row in zip(keys, rows)}
+    return arr_answer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Повторный расчёт измерений')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--workers', type=int, default=pool_workers)
+    args = parser.parse_args()
+    pool_workers = args.workers
+    print(json.dumps(reprocess(args.files), indent=1))
+    shutdown_pool()
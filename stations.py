@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pyvisa
+from vna_session import get_session, address
+from acquisition import Acquisition, read_caban, read_zoom, read_average, live_idle
+
+# Реестр стендов: у каждого резонатора свой анализатор, сеанс и поток съёма
+stations_file = 'data_base/stations.txt'
+default_station = '1'
+
+_stations = {}
+_stations_lock = threading.Lock()
+
+
+class Station():
+    def __init__(self, station_id, address):
+        self.id = station_id
+        self.address = address
+        self.session = get_session(address)
+        self.engine = Acquisition(self.sweep)
+
+    def run(self, func, *args):
+        try:
+            return self.session.run(func, *args)
+        except pyvisa.errors.VisaIOError:
+            print("{:30}".format("Station: " + self.id) + "{:>40}".format(" not answer"))
+            return 0
+
+    def sweep(self, start_f = 8, stop_f = 12, binary = True):
+        return self.run(read_caban, start_f, stop_f, binary)
+
+    def zoom(self, start_f = 8, stop_f = 12, binary = True):
+        return self.run(read_zoom, start_f, stop_f, binary)
+
+    def average(self, n, start_f = 8, stop_f = 12, binary = True):
+        # При настройках фоновой развёртки кадры берутся из неё, иначе - отдельная серия в сеансе
+        if (start_f, stop_f, binary) == (8, 12, True):
+            return self.engine.averaged(n)
+        return self.run(read_average, n, start_f, stop_f, binary)
+
+    def live_frame(self):
+        # Последний кадр буфера - только если развёртка уже шла и кадр свежий, иначе ждём новый
+        started = self.engine.start()
+        data = self.engine.latest()
+        if started or data is None or time.monotonic() - data['time'] > live_idle:
+            data = self.engine.frame()
+        return data
+
+
+def load_stations(file_name = stations_file):
+    # {"1": "TCPIP0::localhost::5025::SOCKET", "2": "TCPIP0::192.168.0.12::5025::SOCKET"}
+    try:
+        with open(file_name) as file:
+            arr_address = json.load(file)
+    except FileNotFoundError:
+        arr_address = {default_station: address}
+    with _stations_lock:
+        for station_id in arr_address:
+            if station_id not in _stations or _stations[station_id].address != arr_address[station_id]:
+                _stations[str(station_id)] = Station(str(station_id), arr_address[station_id])
+    return arr_address
+
+
+def register_station(station_id, station_address, file_name = stations_file):
+    station_id = str(station_id)
+    with _stations_lock:
+        _stations[station_id] = Station(station_id, station_address)
+        arr_address = {i: _stations[i].address for i in _stations}
+    f = open(file_name, 'w')
+    f.write(json.dumps(arr_address))
+    f.close()
+    return _stations[station_id]
+
+
+def get_station(station_id = None):
+    if station_id is None or station_id == '':
+        station_id = default_station
+    station_id = str(station_id)
+    with _stations_lock:
+        known = station_id in _stations
+    if not known:
+        load_stations()
+    with _stations_lock:
+        if station_id not in _stations:
+            raise ValueError(f"Стенд {station_id} не найден в {stations_file}")
+        return _stations[station_id]
+
+
+def sweep_stations(station_ids, func = 'sweep', *args):
+    # Одновременный съём на нескольких стендах, результат {id стенда: кадр}
+    arr_station = [get_station(station_id) for station_id in station_ids]
+    with ThreadPoolExecutor(max_workers=max(len(arr_station), 1)) as pool:
+        futures = {station.id: pool.submit(getattr(station, func), *args) for station in arr_station}
+    return {station_id: futures[station_id].result() for station_id in futures}
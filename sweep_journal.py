@@ -0,0 +1,118 @@
+import datetime
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+
+# Журнал сырых развёрток: каждая запись - заголовок, JSON с настройками и временем этапов, массивы float64
+journal_dir = 'data_journal'
+journal_queue = 256 # Сколько кадров может ждать записи; сверх этого кадры отбрасываются
+magic = b'FSJ1'
+header = struct.Struct('<4sIII') # метка, длина JSON, точек y, точек x (0 - ось записана раньше)
+
+
+def journal_name(day=None):
+    if day is None:
+        day = datetime.datetime.now()
+    return journal_dir + '/sweeps_' + day.strftime('%Y%m%d') + '.bin'
+
+
+class SweepJournal():
+    # Запись идёт в отдельном потоке, съём кадров никогда не ждёт диск
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.queue = queue.Queue(journal_queue)
+        self.thread = None
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._loop, name='sweep_journal', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def append(self, frame, config):
+        meta = dict(config)
+        meta['timestamp'] = time.time()
+        meta['x_ref'] = frame.get('x_ref')
+        meta['timing'] = frame.get('timing', {})
+        try:
+            self.queue.put_nowait((meta, frame['x'], frame['y']))
+        except queue.Full:
+            self.dropped += 1
+
+    def _loop(self):
+        file = None
+        file_name = None
+        axes = set()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            meta, arr_x, arr_y = item
+            name = self.file_name or journal_name()
+            if name != file_name:
+                if file is not None:
+                    file.close()
+                os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+                axes = set(entry['x_ref'] for entry in read_journal(name, arrays=False)) if os.path.exists(name) else set()
+                file = open(name, 'ab')
+                file_name = name
+            # Ось пишется в файл один раз на каждую конфигурацию развёртки
+            write_x = meta['x_ref'] is None or meta['x_ref'] not in axes
+            axes.add(meta['x_ref'])
+            file.write(pack_entry(meta, arr_x if write_x else None, arr_y))
+            file.flush()
+            self.written += 1
+        if file is not None:
+            file.close()
+
+
+def pack_entry(meta, arr_x, arr_y):
+    meta_raw = json.dumps(meta).encode()
+    y_raw = np.asarray(arr_y, dtype='<f8').tobytes()
+    x_raw = b'' if arr_x is None else np.asarray(arr_x, dtype='<f8').tobytes()
+    return header.pack(magic, len(meta_raw), len(y_raw) // 8, len(x_raw) // 8) + meta_raw + y_raw + x_raw
+
+
+def read_journal(file_name, arrays=True):
+    # Разбор журнала для повторной обработки: словари с настройками, временем этапов, x и y
+    axes = {}
+    with open(file_name, 'rb') as file:
+        while True:
+            head = file.read(header.size)
+            if len(head) < header.size:
+                return
+            mark, meta_len, n_y, n_x = header.unpack(head)
+            if mark != magic:
+                raise ValueError(f"Повреждённая запись журнала в {file_name}")
+            entry = json.loads(file.read(meta_len))
+            if not arrays:
+                file.seek(8 * (n_y + n_x), 1)
+                yield entry
+                continue
+            entry['y'] = np.frombuffer(file.read(8 * n_y), dtype='<f8')
+            if n_x:
+                axes[entry['x_ref']] = np.frombuffer(file.read(8 * n_x), dtype='<f8')
+            entry['x'] = axes.get(entry['x_ref'])
+            yield entry
+
+
+def stage_summary(file_name):
+    # Среднее время этапов по журналу, мс
+    arr_timing = {}
+    for entry in read_journal(file_name, arrays=False):
+        for stage in entry['timing']:
+            arr_timing.setdefault(stage, []).append(entry['timing'][stage])
+    return {stage: 1000 * float(np.mean(arr_timing[stage])) for stage in arr_timing}
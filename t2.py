@@ -3,7 +3,7 @@ import datetime
 from os import write
 from pprint import pprint
 from All_Methods_3 import *
-import sqlite3 as sql
+from resonance import DataArrDist
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 from fpdf import FPDF , HTMLMixin
@@ -11,33 +11,18 @@ from fpdf import FPDF , HTMLMixin
 def toFixed(numObj, digits=0):
     return f"{numObj:.{digits}f}"
 
-def closest_value(input_list, input_value):
-    arr = np.asarray(input_list)
-    i = (np.abs(arr - input_value)).argmin()
-    return arr[i]
-
 def Test_Methot(r, R, fE, f0, QE, Q0):
 
     E = 1 + 0.539 * pow((R/r), 2) * ((float(fE) - float(f0)) / float(f0))
     tgo = (0.269 / E) * pow(R / r, 2) * ((1 / QE) - (1 / Q0))
 
     return f"E = {E}, tgo = {tgo}"
-def DataArrDist(arr_x, arr_y):
-    float_list = [float(i) for i in arr_y]
-    index_res = float_list.index(min(float_list))
-    f0 = arr_x[index_res]
-    print(float_list)
-    f1 = arr_x[float_list.index(closest_value(float_list[(index_res - 50):index_res], (min(float_list) + 3)))]
-    f2 = arr_x[float_list.index(closest_value(float_list[index_res:index_res + 50], (min(float_list) + 3)))]
-    Q = float(f0)/(float(f2)-float(f1))
-    return {'f0': f0, 'f1': f1, 'f2': f2, 'Q':Q}
 
 
-# with open('data_base/db_ferro.txt' ) as file:
-#   data_db = json.load(file)
-#   print(data_db)
-#   for data in data_db:
-#     print(data_db[data]['measure_id'])
+# data_db = measure_index()
+# print(data_db)
+# for data in data_db:
+#   print(data['measure_id'])
 # print(datetime.datetime.now().strftime('%d%m%Y'))
 #
 # f = open('data_ferro/XF3bUZo_1_QoZR-PljCzeA', 'w')
@@ -49,8 +34,9 @@ def DataArrDist(arr_x, arr_y):
 #     print(Methot_Marina(float(data['data_param']['data[3][d]']), float(data['f0']), float(data['f1']), float(data['f2']), float(data['y_samples'][i]['fe']), float(data['data_param']['data[3][d_res]'])/2, float(data['data_param']['data[3][h_res]']), float(data['A0']), float(data['y_samples'][i]['AE'])))
 #
 
-connection = sql.connect('data_base/test.db')
-cursor = connection.cursor()
+from measure_db import execute, measure_index
+from measure_store import load_measure
+from axis_cache import measure_x
 
 # Создаем таблицу ferro_measures
 # cursor.execute('''
@@ -67,10 +53,9 @@ cursor = connection.cursor()
 # ''')
 currentDateTime = datetime.datetime.now()
 # Добавляем нового пользователя
-#cursor.execute('INSERT INTO measures (method_id, measure_id, title, description,  date_create) VALUES (?, ?, ?, ?, ?)', (3, '8QRYGvWU001XOAZuFDU2bg', 'СВЧФ_2_221223','Описание', datetime.datetime.now()))
-# cursor.execute('DELETE  FROM measures  WHERE id = 1')
-cursor.execute('SELECT * FROM measures ')
-data_db = cursor.fetchall()
+#execute('INSERT INTO measures (method_id, measure_id, title, description,  date_create) VALUES (?, ?, ?, ?, ?)', (3, '8QRYGvWU001XOAZuFDU2bg', 'СВЧФ_2_221223','Описание', datetime.datetime.now()))
+# execute('DELETE  FROM measures  WHERE id = 1')
+data_db = measure_index()
 #
 for data in data_db:
    print(data)
@@ -188,22 +173,9 @@ def create_pdf(arr_data, data_bd):
 print(float("+9.655000000E+09"))
 
 # arr_measures = []
-# with open('data_base/db_ferro.txt' ) as file:
-#     data_db = json.load(file)
-#     for data in data_db:
-#         with open('data_ferro/' + data_db[data]['measure_id'] + '.txt') as file_measure:
-#             data_measure = json.load(file_measure)
-#
-#             arr_end = data['y']
-#             float_list = [float(i) for i in arr_end]
-#             index_res = float_list.index(min(float_list))
-#             f0 = data['x'][index_res]
-#             f1 = data['x'][
-#             float_list.index(closest_value(float_list[(index_res - 50):index_res], (min(float_list) + 3)))]
-#             f2 = data['x'][float_list.index(closest_value(float_list[index_res:index_res + 50], (min(float_list) + 3)))]
-#
-#             cursor.execute('INSERT INTO measures (method_id, measure_id, title, description,  date_create) VALUES (?, ?, ?, ?, ?)', (float(data_measure['data_param']['method']), data_db[data]['measure_id'], data_measure['title'],data_db[data]['description'], datetime.datetime.now()))
-#             create_pdf(data_measure, data_db[data])
+# for data_bd in measure_index():
+#     data_measure = load_measure(data_bd['measure_id'])
+#     create_pdf(data_measure, data_bd)
 
 # with open('data_ferro/kpFp5fZ0cXELee5zBzMclw.txt') as file_measure:
 #     data_measure = json.load(file_measure)
@@ -238,31 +210,28 @@ print(float("+9.655000000E+09"))
     # print(Result)
 
 
-with open('data_ferro/ZUryV57LaMjeE9mdWbjB_w.txt') as file_measure:
-    data_measure = json.load(file_measure)
-    arr_end = data_measure['y_res']
-    # print(DataArrDist(data_measure['x'], arr_end))
-    # print(data_measure)
-    data = data_measure
-    for i in data['y_samples']:
-        ResSample2 = DataArrDist(data['x'], data['y_samples'][i]['y_res'])
-        # print(ResSample2)
-        arr_results2 = Method_real(float(ResSample2['f0']), float(data['f0']), float(data['f1']),
-                                  float(data['f2']), float(ResSample2['f1']), float(ResSample2['f2']),
-                                  float(data['data_param']['data[4][d_res]']),
-                                  float(data['data_param']['data[4][d_sample]']))
-    #     print('Образец № ' + str(i))
-    #     print(arr_results2)
-    # print('________________')
-    ResSample = DataArrDist(data_measure['x'], data_measure['y_samples']['1']['y_res'])
-    Result = Method_real(float(data_measure['y_samples']['1']['fe']), float(data_measure['f0']), float(data_measure['f1']), float(data_measure['f2']), float(ResSample['f1']), float(ResSample['f2']), float(data_measure['data_param']['data[4][d_res]']),float(data_measure['data_param']['data[4][d_sample]']))
-    Result1 = Methot_Egor_st(float(data_measure['y_samples']['1']['fe']), float(data_measure['f0']),
-                         float(data_measure['f1']), float(data_measure['f2']), float(ResSample['f1']),
-                         float(ResSample['f2']), float(data_measure['data_param']['data[4][d_res]']),
-                         float(data_measure['data_param']['data[4][d_sample]']))
-    # print(Result)
-    # print(Result1)
-
+data_measure = load_measure('ZUryV57LaMjeE9mdWbjB_w')
+data_measure['x'] = measure_x(data_measure)
+arr_end = data_measure['y_res']
+# print(DataArrDist(data_measure['x'], arr_end))
+# print(data_measure)
+data = data_measure
+for i in data['y_samples']:
+    ResSample2 = DataArrDist(data['x'], data['y_samples'][i]['y_res'])
+    # print(ResSample2)
+    arr_results2 = Method_real(float(ResSample2['f0']), float(data['f0']), float(data['f1']),
+                              float(data['f2']), float(ResSample2['f1']), float(ResSample2['f2']),
+                              float(data['data_param']['data[4][d_res]']),
+                              float(data['data_param']['data[4][d_sample]']))
+#     print('Образец № ' + str(i))
+#     print(arr_results2)
+# print('________________')
+ResSample = DataArrDist(data_measure['x'], data_measure['y_samples']['1']['y_res'])
+Result = Method_real(float(data_measure['y_samples']['1']['fe']), float(data_measure['f0']), float(data_measure['f1']), float(data_measure['f2']), float(ResSample['f1']), float(ResSample['f2']), float(data_measure['data_param']['data[4][d_res]']),float(data_measure['data_param']['data[4][d_sample]']))
+Result1 = Methot_Egor_st(float(data_measure['y_samples']['1']['fe']), float(data_measure['f0']),
+                     float(data_measure['f1']), float(data_measure['f2']), float(ResSample['f1']),
+                     float(ResSample['f2']), float(data_measure['data_param']['data[4][d_res]']),
+                     float(data_measure['data_param']['data[4][d_sample]']))
+# print(Result)
+# print(Result1)
 
-connection.commit()
-connection.close()
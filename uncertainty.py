@@ -0,0 +1,86 @@
+import numpy as np
+from methods_batch import Methot_Vlad_batch, Methot_Nikita_batch, Methot_Marina_batch, Method_real_batch
+
+# Оценка погрешности E и tgo методом Монте-Карло: все розыгрыши всех образцов считаются одним вызовом метода
+mc_draws = 10000 # Розыгрышей на образец
+mc_level = 0.95 # Доверительная вероятность интервала
+mc_sigma = {'size': 0.01, 'freq': None, 'level': 0.1} # СКО входов: размеры в мм, частоты в Гц (None - по шагу сетки), уровни в дБ
+
+# Метод и вид каждого входа по порядку аргументов (None - вход не разыгрывается).
+# ('Q', j) - добротность резонанса с центром во входе j: разыгрываются обе границы полосы (шум ширины sqrt(2) СКО частоты)
+batch_methods = {
+    '1': (Methot_Vlad_batch, ['size', 'size', 'freq', 'freq', 'freq', 'freq', 'size', 'size', 'level', 'level']),
+    '2': (Methot_Nikita_batch, ['size', 'size', 'size', 'freq', 'freq', 'freq', 'freq', 'level', 'level']),
+    '3': (Methot_Marina_batch, ['size', 'freq', 'freq', 'freq', 'freq', 'size', 'size', 'level', 'level', ('Q', 1), ('Q', 4)]),
+    '4': (Method_real_batch, ['freq', 'freq', 'freq', 'freq', 'freq', 'freq', 'size', 'size']),
+}
+
+
+def freq_sigma(arr_x):
+    # Частота резонанса известна с точностью до шага сетки: СКО равномерного распределения на шаге
+    arr_x = np.asarray(arr_x, dtype=np.float64)
+    if len(arr_x) < 2:
+        return 0.0
+    return float(np.median(np.abs(np.diff(arr_x)))) / np.sqrt(12)
+
+
+def run_method(method, args):
+    func, kinds = batch_methods[method]
+    return func(*args)
+
+
+def monte_carlo(method, args, sigma=None, draws=mc_draws, level=mc_level, seed=None):
+    # args - входы метода (числа или массивы по образцам); результат - массивы по образцам
+    func, kinds = batch_methods[method]
+    sigma = dict(mc_sigma, **(sigma or {}))
+    rng = np.random.default_rng(seed)
+    # Общие входы (резонатор) разыгрываются одинаково для всех образцов одного розыгрыша
+    arr_args = [np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in args]
+    draw_args = []
+    for value, kind in zip(arr_args, kinds):
+        scale = sigma.get(kind) if isinstance(kind, str) else None
+        if not scale:
+            draw_args.append(value[None, :])
+        else:
+            draw_args.append(value[None, :] + scale * rng.standard_normal((draws,) + value.shape))
+    # Добротность - по разыгранному центру и ширине полосы f0 / Q
+    for k, kind in enumerate(kinds):
+        if isinstance(kind, tuple) and sigma.get('freq'):
+            j = kind[1]
+            width = arr_args[j] / arr_args[k] + np.sqrt(2) * sigma['freq'] * rng.standard_normal((draws,) + arr_args[k].shape)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                draw_args[k] = draw_args[j] / width
+    result = func(*draw_args)
+    # Интервал строится по всем конечным значениям; доля розыгрышей в допустимых пределах - отдельно
+    E = np.broadcast_to(result['E'], result['valid'].shape)
+    tgo = np.broadcast_to(result['tgo'], result['valid'].shape)
+    q = [(1 - level) / 2, (1 + level) / 2]
+    with np.errstate(invalid='ignore'):
+        E_ci = interval(E, q)
+        tgo_ci = interval(tgo, q)
+    return {'E_low': E_ci[0], 'E_high': E_ci[1], 'E_std': E_ci[2],
+            'tgo_low': tgo_ci[0], 'tgo_high': tgo_ci[1], 'tgo_std': tgo_ci[2],
+            'valid_share': np.mean(result['valid'], axis=0), 'draws': draws, 'level': level}
+
+
+def interval(values, q):
+    # Квантили по розыгрышам без учёта nan; образец без конечных значений - nan
+    values = np.where(np.isfinite(values), values, np.nan)
+    count = np.sum(np.isfinite(values), axis=0)
+    arr = np.sort(values, axis=0)
+    low = np.full(arr.shape[1], np.nan)
+    high = np.full(arr.shape[1], np.nan)
+    std = np.full(arr.shape[1], np.nan)
+    for j in np.flatnonzero(count):
+        col = arr[:count[j], j]
+        low[j], high[j] = np.quantile(col, q)
+        std[j] = col.std()
+    return low, high, std
+
+
+def interval_row(result, k):
+    # Интервалы k-го образца для ответа method_end
+    return {'E_ci': [float(result['E_low'][k]), float(result['E_high'][k])],
+            'tgo_ci': [float(result['tgo_low'][k]), float(result['tgo_high'][k])],
+            'E_std': float(result['E_std'][k]), 'tgo_std': float(result['tgo_std'][k]),
+            'valid_share': float(result['valid_share'][k]), 'level': result['level']}
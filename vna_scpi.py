@@ -0,0 +1,82 @@
+import time
+
+trigger_hold = "INIT1:CONT OFF" # Остановить непрерывную развёртку
+trigger_single = "INIT1:IMM" # Однократная развёртка
+opc_timeout = 10000 # Таймаут ожидания *OPC?, мс (развёртка длиннее обычного таймаута 500 мс)
+scpi_verbose = False # Печатать время каждого сообщения (при непрерывной развёртке - десятки строк в секунду)
+
+
+def toFixed(numObj, digits=0):
+    return f"{numObj:.{digits}f}"
+
+
+def join_commands(commands):
+    # Команды с полным путём отделяются ";:", общие (*OPC?, *CLS) - ";"
+    message = ''
+    for command in commands:
+        command = command.lstrip(':')
+        if message:
+            message += ';' if command.startswith('*') else ';:'
+        message += command
+    return message
+
+
+class Scpi():
+    # Слой команд поверх Messager: установки пишутся без чтения, синхронизация через *OPC?
+    def __init__(self, messager):
+        self.messager = messager
+        self.pending = []
+        self.timing = []
+
+    def _timed(self, message, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        delay = time.perf_counter() - start
+        self.timing.append((message, delay))
+        if scpi_verbose:
+            print("{:30}".format("Message: " + message) + "{:>40}".format(" time: " + toFixed(delay * 1000, 1) + " ms"))
+        return result
+
+    def set(self, command):
+        self.pending.append(command)
+        return self
+
+    def flush(self, opc=True):
+        # Отправка накопленных установок одним сообщением
+        if not self.pending:
+            return True
+        commands = self.pending
+        self.pending = []
+        if opc:
+            return self._opc(join_commands(commands + ['*OPC?']))
+        message = join_commands(commands)
+        self._timed(message, self.messager.write, message)
+        return True
+
+    def query(self, message):
+        self.flush()
+        return self._timed(message, self.messager.query, message)
+
+    def query_binary(self, message):
+        self.flush()
+        return self._timed(message, self.messager.query_binary, message)
+
+    def sweep(self):
+        # Однократная развёртка с ожиданием её окончания
+        self.flush(opc=False)
+        return self._opc(join_commands([trigger_single, '*OPC?']))
+
+    def _opc(self, message):
+        timeout = self.messager.res.timeout
+        self.messager.res.timeout = opc_timeout
+        try:
+            return str(self._timed(message, self.messager.query, message)).strip() == '1'
+        finally:
+            self.messager.res.timeout = timeout
+
+    def report(self):
+        total = sum(delay for message, delay in self.timing)
+        for message, delay in self.timing:
+            print("{:60}".format(message) + "{:>12}".format(toFixed(delay * 1000, 1) + " ms"))
+        print("{:60}".format("Total") + "{:>12}".format(toFixed(total * 1000, 1) + " ms"))
+        return self.timing
@@ -0,0 +1,122 @@
+import threading
+import time
+import pyvisa
+import numpy as np
+
+address = "TCPIP0::localhost::5025::SOCKET"
+idle_check = 5 # Через сколько секунд простоя проверять связь через *IDN?
+
+_rm = None
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def resource_manager():
+    global _rm
+    if _rm is None:
+        _rm = pyvisa.ResourceManager()
+    return _rm
+
+
+class Messager():
+    def __init__(self, address=address, rm=None, strict=False):
+        if rm is None:
+            rm = resource_manager()
+        self.strict = strict
+        self.res = rm.open_resource(address, timeout=500)
+        self.res.read_termination = '\n'
+        self.res.write_termination = '\n'
+
+    def query(self, message:str):
+        try:
+            tmp = self.res.query(message)
+            # print("{:30}".format("Message: " + message) + "{:>40}".format(" return: " + tmp))
+            return tmp
+        except pyvisa.errors.VisaIOError:
+            print("{:30}".format("Message: " + message) + "{:>40}".format(" not answer"))
+            if self.strict:
+                raise
+            print("ERROR ERROR")
+            return 0
+
+    def query_binary(self, message: str):
+        try:
+            return self.res.query_binary_values(message, datatype='d', is_big_endian=False, container=np.array)
+        except pyvisa.errors.VisaIOError:
+            print("{:30}".format("Message: " + message) + "{:>40}".format(" not answer"))
+            if self.strict:
+                raise
+            print("ERROR ERROR")
+            return 0
+
+    def write(self, message: str):
+        self.res.write(message)
+        print("{:30}".format("Message: " + message))
+
+    def close(self):
+        try:
+            self.res.close()
+        except pyvisa.errors.VisaIOError:
+            pass
+
+
+class VnaSession():
+    # Одно соединение с анализатором на процесс, вызовы идут по очереди через lock
+    def __init__(self, address=address):
+        self.address = address
+        self.lock = threading.RLock()
+        self.messager = None
+        self.idn = None
+        self.last_used = 0
+
+    def connect(self):
+        self.close()
+        self.messager = Messager(self.address, strict=True)
+        self.idn = self.messager.query("*IDN?")
+        self.last_used = time.monotonic()
+        print("{:30}".format("Connect: " + self.address) + "{:>40}".format(" " + self.idn))
+
+    def close(self):
+        if self.messager is not None:
+            self.messager.close()
+        self.messager = None
+
+    def check(self):
+        with self.lock:
+            if self.messager is None:
+                return False
+            try:
+                self.idn = self.messager.query("*IDN?")
+                return True
+            except pyvisa.errors.VisaIOError:
+                self.close()
+                return False
+
+    def run(self, func, *args, **kwargs):
+        # func(messager, ...) выполняется под lock; при обрыве связи - переподключение и повтор
+        with self.lock:
+            if self.messager is None or (time.monotonic() - self.last_used > idle_check and not self.check()):
+                self.connect()
+            try:
+                result = func(self.messager, *args, **kwargs)
+            except pyvisa.errors.VisaIOError:
+                print("{:30}".format("Reconnect: " + self.address))
+                self.connect()
+                result = func(self.messager, *args, **kwargs)
+            self.last_used = time.monotonic()
+            return result
+
+
+def get_session(address=address):
+    with _sessions_lock:
+        if address not in _sessions:
+            _sessions[address] = VnaSession(address)
+        return _sessions[address]
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            with session.lock:
+                session.close()
+        _sessions.clear()
@@ -0,0 +1,178 @@
+import argparse
+import socketserver
+import threading
+import time
+import numpy as np
+from measure_store import read_measure_file
+
+# Имитатор анализатора цепей на TCP-сокете (порт 5025) для проверки и замеров без прибора
+
+idn = "FERRO,VNA-SIM,0,1.0"
+
+
+def resonance_params(arr_x, arr_y):
+    # Параметры провала (f0, Q, глубина, уровень) из записанной трассы
+    arr_x = np.asarray(arr_x, dtype=np.float64)
+    arr_y = np.asarray(arr_y, dtype=np.float64)
+    index_res = int(arr_y.argmin())
+    base = float(np.median(arr_y))
+    depth = base - float(arr_y[index_res])
+    level = arr_y[index_res] + 3
+    left = np.nonzero(arr_y[:index_res] >= level)[0]
+    right = np.nonzero(arr_y[index_res:] >= level)[0]
+    f1 = arr_x[left[-1]] if len(left) else arr_x[0]
+    f2 = arr_x[index_res + right[0]] if len(right) else arr_x[-1]
+    Q = float(arr_x[index_res] / max(f2 - f1, arr_x[1] - arr_x[0]))
+    return {'f0': float(arr_x[index_res]), 'Q': Q, 'depth': depth, 'base': base}
+
+
+def load_resonances(file_name):
+    # Затравочные резонансы из файла измерения: свободный резонатор и все образцы
+    data = read_measure_file(file_name)
+    arr_x = data['x']
+    arr_res = [resonance_params(arr_x, data['y_res'])]
+    for i in data['y_samples']:
+        arr_res.append(resonance_params(arr_x, data['y_samples'][i]['y_res']))
+    return arr_res
+
+
+class Analyzer():
+    def __init__(self, resonances, points=801, sweep_time=0.05, noise=0.05, seed=None):
+        self.resonances = resonances
+        self.trace = 0
+        self.start = 8 * 10**9
+        self.stop = 12 * 10**9
+        self.points = points
+        self.sweep_time = sweep_time
+        self.noise = noise
+        self.binary = False
+        self.little = False
+        self.continuous = True
+        self.done = 0
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.data = self.synth()
+
+    def axis(self):
+        return np.linspace(self.start, self.stop, self.points)
+
+    def synth(self):
+        res = self.resonances[self.trace % len(self.resonances)]
+        arr_x = self.axis()
+        delta = 2 * res['Q'] * (arr_x - res['f0']) / res['f0']
+        arr_y = res['base'] - res['depth'] / (1 + delta ** 2) + self.rng.normal(0, self.noise, self.points)
+        data = np.zeros(2 * self.points)
+        data[0::2] = arr_y
+        return data
+
+    def trigger(self):
+        # Новая развёртка готова через sweep_time
+        self.done = time.monotonic() + self.sweep_time
+        self.data = self.synth()
+
+    def block(self, arr):
+        if not self.binary:
+            return ','.join('{:+.9E}'.format(v) for v in arr).encode()
+        raw = np.asarray(arr, dtype='<f8' if self.little else '>f8').tobytes()
+        size = str(len(raw))
+        return b'#' + str(len(size)).encode() + size.encode() + raw
+
+    def command(self, command):
+        head, _, arg = command.strip().partition(' ')
+        head = head.upper().lstrip(':')
+        value = arg.strip().upper()
+        match head:
+            case '*IDN?':
+                return idn.encode()
+            case '*OPC?':
+                time.sleep(max(self.done - time.monotonic(), 0))
+                return b'1'
+            case '*CLS' | '*RST':
+                return None
+            case 'SENS:FREQ:STAR' | 'SENS1:FREQ:STAR':
+                self.start = frequency(value)
+            case 'SENS:FREQ:STOP' | 'SENS1:FREQ:STOP':
+                self.stop = frequency(value)
+            case 'SENS:SWE:POIN' | 'SENS1:SWE:POIN':
+                self.points = int(float(value))
+            case 'SENS:SWE:POIN?' | 'SENS1:SWE:POIN?':
+                return str(self.points).encode()
+            case 'SENS:SWE:TYPE?' | 'SENS1:SWE:TYPE?':
+                return b'LIN'
+            case 'FORM:DATA':
+                self.binary = value.startswith('REAL')
+            case 'FORM:BORD':
+                self.little = value == 'SWAP'
+            case 'INIT:CONT' | 'INIT1:CONT':
+                self.continuous = value in ('ON', '1')
+            case 'INIT:IMM' | 'INIT1:IMM' | 'INIT' | 'INIT1':
+                self.trigger()
+            case 'SIM:TRAC':
+                self.trace = int(value)
+            case 'CALC:DATA:FDAT?' | 'CALC1:DATA:FDAT?':
+                if self.continuous:
+                    self.trigger()
+                time.sleep(max(self.done - time.monotonic(), 0))
+                return self.block(self.data)
+            case 'CALC:DATA:XAX?' | 'CALC1:DATA:XAX?' | 'CALC:DATA:XAXIS?' | 'CALC1:DATA:XAXIS?':
+                return self.block(self.axis())
+        return None
+
+    def message(self, message):
+        answers = []
+        with self.lock:
+            for command in message.split(';'):
+                if command.strip():
+                    answer = self.command(command)
+                    if answer is not None:
+                        answers.append(answer)
+        if not answers:
+            return None
+        return b';'.join(answers) + b'\n'
+
+
+def frequency(value):
+    units = {'HZ': 1, 'KHZ': 10**3, 'MHZ': 10**6, 'GHZ': 10**9}
+    value = value.replace(' ', '')
+    for unit in sorted(units, key=len, reverse=True):
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) * units[unit]
+    return float(value)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            answer = self.server.analyzer.message(line.decode().strip())
+            if answer is not None:
+                self.wfile.write(answer)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, analyzer, port=5025, host='localhost'):
+        super().__init__((host, port), Handler)
+        self.analyzer = analyzer
+
+
+def serve(analyzer, port=5025, host='localhost'):
+    # Запуск в фоновом потоке, возвращает сервер (server.shutdown() для остановки)
+    server = Server(analyzer, port, host)
+    threading.Thread(target=server.serve_forever, name='vna_sim', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Имитатор анализатора цепей (SCPI по TCP)')
+    parser.add_argument('--port', type=int, default=5025)
+    parser.add_argument('--seed-file', default='r_data.txt')
+    parser.add_argument('--points', type=int, default=801)
+    parser.add_argument('--sweep-time', type=float, default=0.05)
+    parser.add_argument('--noise', type=float, default=0.05)
+    args = parser.parse_args()
+    analyzer = Analyzer(load_resonances(args.seed_file), args.points, args.sweep_time, args.noise)
+    server = Server(analyzer, args.port)
+    print("{:30}".format("VNA simulator") + "{:>40}".format(" port: " + str(args.port)))
+    server.serve_forever()